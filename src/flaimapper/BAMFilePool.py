@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+
+"""FlaiMapper: computational annotation of small ncRNA derived fragments using RNA-seq high throughput data
+
+ Here we present Fragment Location Annotation Identification mapper
+ (FlaiMapper), a method that extracts and annotates the locations of
+ sncRNA-derived RNAs (sncdRNAs). These sncdRNAs are often detected in
+ sequencing data and observed as fragments of their  precursor sncRNA.
+ Using small RNA-seq read alignments, FlaiMapper is able to annotate
+ fragments primarily by peak-detection on the start and  end position
+ densities followed by filtering and a reconstruction processes.
+ Copyright (C) 2011-2014:
+ - Youri Hoogstrate
+ - Elena S. Martens-Uzunova
+ - Guido Jenster
+ 
+ 
+ [License: GPL3]
+ 
+ This file is part of flaimapper.
+ 
+ flaimapper is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ flaimapper is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+
+
+import os,re,random,operator,argparse,sys,multiprocessing,heapq
+import numpy
+import pysam
+
+
+
+class BAMFilePool:
+	"""Keeps the BAM files of a run opened.
+	
+	Opening a BAM file and loading its index is relatively expensive.
+	Instead of doing this for every masked region, each file is opened
+	and its index is validated only once. The reference names are
+	stored as a set, so checking whether a masked region is covered by
+	a file does not require a scan of its header.
+	
+	Alignments of collapsed reads may represent multiple identical
+	reads. Their number can be taken from a BAM tag or from a '_x123'
+	suffix of the read name, see get_weight().
+	"""
+	regex_collapsed = re.compile("_x([0-9]+)$")
+	
+	def __init__(self,alignments,verbosity,weight_tag=None,weight_from_name=False):
+		self.verbosity = verbosity
+		
+		self.weight_tag = weight_tag
+		self.weight_from_name = weight_from_name
+		self.weighted = (weight_tag != None) or weight_from_name
+		
+		self.handles = []
+		for bam_file in alignments:
+			self.handles.append(self.open(bam_file))
+	
+	def open(self,bam_file):
+		fh = pysam.Samfile(bam_file)
+		
+		# Check if a valid index exists by requesting the very first element
+		# Indices are normally built by index_alignments() before the
+		# analysis starts, this is only a fallback.
+		if(len(fh.references) > 0):
+			try:
+				fh.fetch(fh.references[0], 0, 0)
+			except:
+				fh.close()
+				
+				if(self.verbosity == "verbose"):
+					print " - Indexing BAM file: "+bam_file
+				error = index_alignment(bam_file)
+				if(error != None):
+					raise IOError(error)
+				
+				fh = pysam.Samfile(bam_file)
+		
+		return (fh,set(fh.references))
+	
+	def get_weight(self,read):
+		"""Returns the number of identical reads an alignment represents,
+		which is 1 unless the reads were collapsed.
+		"""
+		if(self.weight_tag):
+			try:
+				return int(read.get_tag(self.weight_tag))
+			except KeyError:
+				pass
+		elif(self.weight_from_name):
+			m = self.regex_collapsed.search(read.query_name)
+			if(m):
+				return int(m.group(1))
+		
+		return 1
+	
+	def fetch(self,name,start,stop):
+		"""Iterates over the (mapped) alignments of all BAM files that
+		overlap with the given region.
+		"""
+		for fh,references in self.handles:
+			if(name in references):
+				for read in fh.fetch(name, start, stop):
+					if(not read.is_unmapped):
+						yield read
+	
+	def stream(self,name,start=None,stop=None):
+		"""Iterates once over all alignments on a reference sequence (or
+		those overlapping with the given region), in all BAM files
+		simultaneously. Each alignment is returned as a (start, stop,
+		weight) tuple of 0-based coordinates and the tuples are sorted
+		on their start position.
+		
+		The BAM files must be sorted by coordinate.
+		"""
+		streams = []
+		for fh,references in self.handles:
+			if(name in references):
+				streams.append(self.stream_file(fh,name,start,stop))
+		
+		return heapq.merge(*streams)
+	
+	def stream_file(self,fh,name,start=None,stop=None):
+		if(self.weighted):
+			for read in fh.fetch(name,start,stop):
+				if(not read.is_unmapped):
+					yield (read.reference_start,read.reference_end-1,self.get_weight(read))
+		else:
+			for read in fh.fetch(name,start,stop):
+				if(not read.is_unmapped):
+					yield (read.reference_start,read.reference_end-1,1)
+	
+	def stream_batches(self,name,batch_size=65536):
+		"""Vectorized version of stream(): the alignments are returned
+		as (starts, stops, weights) tuples of numpy arrays, of which the
+		start positions are sorted.
+		
+		The batches of the BAM files are merged up to the lowest of
+		their last start positions; the remaining alignments are kept
+		until the next batch of their file has been read.
+		"""
+		files = []
+		for fh,references in self.handles:
+			if(name in references):
+				batches = self.stream_file_batches(fh,name,batch_size)
+				files.append([batches,next(batches,None)])
+		
+		files = [item for item in files if item[1] is not None]
+		while(len(files) > 0):
+			if(len(files) == 1):
+				frontier = None
+			else:
+				frontier = min(item[1][0][-1] for item in files)
+			
+			merged = []
+			for item in files:
+				if(frontier is None or item[1][0][-1] <= frontier):
+					merged.append(item[1])
+					item[1] = next(item[0],None)
+				else:
+					n = numpy.searchsorted(item[1][0],frontier,side='right')
+					merged.append(tuple(column[:n] for column in item[1]))
+					item[1] = tuple(column[n:] for column in item[1])
+			
+			files = [item for item in files if item[1] is not None]
+			
+			if(len(merged) == 1):
+				yield merged[0]
+			else:
+				starts = numpy.concatenate([batch[0] for batch in merged])
+				order = numpy.argsort(starts,kind='mergesort')
+				
+				yield (starts[order],numpy.concatenate([batch[1] for batch in merged])[order],numpy.concatenate([batch[2] for batch in merged])[order])
+	
+	def stream_file_batches(self,fh,name,batch_size):
+		starts = []
+		stops = []
+		weights = []
+		
+		for read in fh.fetch(name):
+			if(not read.is_unmapped):
+				starts.append(read.reference_start)
+				stops.append(read.reference_end-1)
+				if(self.weighted):
+					weights.append(self.get_weight(read))
+				
+				if(len(starts) == batch_size):
+					yield self.to_batch(starts,stops,weights)
+					
+					starts = []
+					stops = []
+					weights = []
+		
+		if(len(starts) > 0):
+			yield self.to_batch(starts,stops,weights)
+	
+	def to_batch(self,starts,stops,weights):
+		starts = numpy.array(starts,dtype=numpy.int64)
+		stops = numpy.array(stops,dtype=numpy.int64)
+		
+		if(self.weighted):
+			weights = numpy.array(weights,dtype=numpy.int64)
+		else:
+			weights = numpy.ones(len(starts),dtype=numpy.int64)
+		
+		return (starts,stops,weights)
+	
+	def close(self):
+		for fh,references in self.handles:
+			fh.close()
+		
+		self.handles = []
+
+
+
+def find_index(bam_file):
+	"""Returns the filename of the index belonging to a BAM file, or
+	None if no index exists.
+	"""
+	for index_file in [bam_file+'.bai', os.path.splitext(bam_file)[0]+'.bai', bam_file+'.csi']:
+		if(os.path.isfile(index_file)):
+			return index_file
+	
+	return None
+
+def requires_index(bam_file):
+	"""An index has to be (re-)built if it is missing or if it is older
+	than the BAM file it belongs to.
+	"""
+	index_file = find_index(bam_file)
+	
+	return (index_file == None) or (os.path.getmtime(index_file) < os.path.getmtime(bam_file))
+
+def index_alignment(bam_file):
+	"""Builds the index of a BAM file. Errors are returned rather than
+	raised, so that this also works within a worker process.
+	
+	----
+	@return: None if the index was built, otherwise the error message
+	"""
+	try:
+		pysam.index(bam_file)
+	except Exception as err:
+		return 'Could not index BAM file: '+bam_file+'\nIs the file sorted by coordinate?\n'+str(err)+'\n'
+	
+	return None
+
+def index_alignments(alignments,threads=1,verbosity="quiet"):
+	"""Checks the indices of all BAM files before the analysis starts and
+	builds the missing or outdated ones in parallel. If a BAM file can
+	not be indexed, the errors are reported and the program exits.
+	
+	----
+	@param alignments: list of BAM filenames
+	@param threads: number of indices that may be built simultaneously
+	
+	@return: the BAM files that have been (re-)indexed
+	@rtype: list
+	"""
+	unindexed = [bam_file for bam_file in alignments if os.path.splitext(bam_file)[1].lower() == '.bam' and requires_index(bam_file)]
+	
+	if(verbosity == "verbose"):
+		for bam_file in unindexed:
+			print " - Indexing BAM file: "+bam_file
+	
+	if(threads > 1 and len(unindexed) > 1):
+		pool = multiprocessing.Pool(min(threads,len(unindexed)))
+		try:
+			errors = pool.map(index_alignment,unindexed)
+		except:
+			pool.terminate()
+			raise
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		errors = [index_alignment(bam_file) for bam_file in unindexed]
+	
+	errors = [error for error in errors if error is not None]
+	if(len(errors) > 0):
+		for error in errors:
+			sys.stderr.write(error)
+		sys.exit(1)
+	
+	return unindexed
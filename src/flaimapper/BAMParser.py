@@ -38,44 +38,76 @@
 
 
 
-import os,re,random,operator,argparse,sys,subprocess
-import pysam
+import os,re,random,operator,argparse,sys
 
 
 from flaimapper.Read import Read
 from flaimapper.ncRNAfragment import ncRNAfragment
 from flaimapper.MaskedRegion import MaskedRegion
+from flaimapper.BAMFilePool import BAMFilePool
 
 
 
 class BAMParser(MaskedRegion):
 	"""parseNcRNA is a class that parses the BAM alignment files using pysam.
+	
+	The alignments can either be given as a list of filenames or as a
+	BAMFilePool, of which the opened handles are shared among all
+	masked regions of a run.
 	"""
-	def parse_reads(self):
+	def get_alignment_pool(self):
+		if(not isinstance(self.alignments,BAMFilePool)):
+			self.alignments = BAMFilePool(self.alignments,self.verbosity)
 		
-		# Check if a valid index exists by requesting the very first element
-		# If it throw's an exception, run 'samtools index' to index.
-		for bam_file in self.alignments:
-			fh = pysam.Samfile(bam_file)
-			
-			if(self.name in fh.references):
-				try:
-					fh.fetch(self.name, 0, 0)
-					fh.close()
-				except:
-					fh.close()
-					try:
-						print ' - Indexing BAM file with samtools: '+bam_file
-						subprocess.call(["samtools", "index", bam_file])# Create index
-					except:
-						sys.stderr.write('Couldn\'t indexing BAM file with samtools: '+bam_file+'\nAre you sure samtools is installed?\n')
+		return self.alignments
+	
+	def parse_reads(self,detailed=False):
+		"""
+		----
+		@param detailed: also extract the names and sequences of the
+		 reads, which is only required for converting alignments
+		"""
+		pool = self.get_alignment_pool()
+		
+		if(detailed):
+			for read in pool.fetch(self.name, self.start, self.stop):
+				# First coordinate is given at 0 base, the second as 1
+				# Therefore the second is converted with "-1"
+				yield Read(read.reference_start,read.reference_end-1,read.query_name,read.query_sequence,pool.get_weight(read))
+		elif(pool.weighted):
+			for read in pool.fetch(self.name, self.start, self.stop):
+				yield Read(read.reference_start,read.reference_end-1,weight=pool.get_weight(read))
+		else:
+			for read in pool.fetch(self.name, self.start, self.stop):
+				yield Read(read.reference_start,read.reference_end-1)
+	
+	def parse_sorted_reads(self):
+		"""Indexed BAM files are sorted by coordinate, so the reads of
+		all files can be merged in order of their start position.
+		"""
+		return self.get_alignment_pool().stream(self.name, self.start, self.stop)
+	
+	def parse_read_batches(self,batch_size=MaskedRegion.buffer_size):
+		"""Returns the coordinates of the reads in batches of (starts,
+		stops, weights) numpy arrays, without creating a Read object for
+		each alignment.
+		"""
+		pool = self.get_alignment_pool()
 		
-		for bam_file in self.alignments:
-			fh = pysam.Samfile(bam_file)
+		starts = []
+		stops = []
+		weights = [] if pool.weighted else None
+		
+		for read in pool.fetch(self.name, self.start, self.stop):
+			starts.append(read.reference_start)
+			stops.append(read.reference_end-1)
+			if(pool.weighted):
+				weights.append(pool.get_weight(read))
 			
-			if(self.name in fh.references):
-				for read in fh.fetch(self.name, self.start, self.stop):
-					
-					# First coordinate is given at 0 base, the second as 1
-					# Therefore the second is converted with "-1"
-					yield Read(read.blocks[0][0],read.blocks[-1][1]-1,read.qname,read.seq)
+			if(len(starts) == batch_size):
+				yield self.to_batch(starts,stops,weights)
+				starts,stops = [],[]
+				weights = [] if pool.weighted else None
+		
+		if(len(starts) > 0):
+			yield self.to_batch(starts,stops,weights)
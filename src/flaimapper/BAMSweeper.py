@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""FlaiMapper: computational annotation of small ncRNA derived fragments using RNA-seq high throughput data
+
+ Here we present Fragment Location Annotation Identification mapper
+ (FlaiMapper), a method that extracts and annotates the locations of
+ sncRNA-derived RNAs (sncdRNAs). These sncdRNAs are often detected in
+ sequencing data and observed as fragments of their  precursor sncRNA.
+ Using small RNA-seq read alignments, FlaiMapper is able to annotate
+ fragments primarily by peak-detection on the start and  end position
+ densities followed by filtering and a reconstruction processes.
+ Copyright (C) 2011-2014:
+ - Youri Hoogstrate
+ - Elena S. Martens-Uzunova
+ - Guido Jenster
+ 
+ 
+ [License: GPL3]
+ 
+ This file is part of flaimapper.
+ 
+ flaimapper is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ flaimapper is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+
+
+import os,re,random,operator,argparse,sys
+import numpy
+
+
+from flaimapper.BAMParser import BAMParser
+
+
+
+class BAMSweeper:
+	"""Alternative for fetching the reads of each masked region separately.
+	
+	Fetching requires a seek into every BAM file, per masked region, and
+	the same compressed blocks may be decompressed over and over again.
+	The BAMSweeper walks once over the (coordinate sorted) alignments of
+	a reference sequence and assigns each read to all masked regions it
+	overlaps. As soon as the alignments have passed a masked region, the
+	region is finished and returned, so the fragment detection can start
+	while the remaining reads are still being parsed.
+	
+	The reads are streamed in batches of numpy arrays (see
+	BAMFilePool.stream_batches()) and added to each masked region with
+	a single call to MaskedRegion.add_reads() per batch.
+	"""
+	buffer_size = 65536
+	
+	def __init__(self,alignment_pool,verbosity,max_depth=0):
+		"""
+		----
+		@param max_depth: see MaskedRegion.set_max_depth()
+		"""
+		self.alignment_pool = alignment_pool
+		self.verbosity = verbosity
+		self.max_depth = max_depth
+	
+	def sweep(self,regions):
+		"""
+		----
+		@param regions: masked regions (as returned by parse_gff) that
+		 are all located on the same reference sequence
+		
+		@return: iterator of (region, BAMParser) tuples of which the
+		 statistics have been parsed, ordered by the end of the regions
+		"""
+		regions = sorted(regions,key=lambda region: (region[1],region[2],region[5]))
+		
+		if(len(regions) > 0):
+			if(self.verbosity == "verbose"):
+				print "   - Reference sequence: "+regions[0][0]+" ("+str(len(regions))+" masked regions)"
+			
+			waiting = 0
+			active = []
+			
+			for starts,stops,weights in self.alignment_pool.stream_batches(regions[0][0],batch_size=self.buffer_size):
+				# The same overlap criteria as pysam's fetch(name, start, stop)
+				last_stop = stops.max()
+				while(waiting < len(regions) and regions[waiting][1] <= last_stop):
+					active.append((regions[waiting],self.get_parser(regions[waiting])))
+					waiting += 1
+				
+				# Reads that overlap with a masked region start at most
+				# the length of the longest read before it
+				longest = (stops - starts).max()
+				for region,aligned_reads in active:
+					first = numpy.searchsorted(starts,region[1] - longest,side='left')
+					last = numpy.searchsorted(starts,region[2],side='left')
+					
+					if(first < last):
+						overlap = stops[first:last] >= region[1]
+						aligned_reads.add_reads(starts[first:last][overlap],stops[first:last][overlap],weights[first:last][overlap])
+				
+				# Masked regions that end before the last read can not
+				# receive any further reads
+				if(len(active) > 0):
+					finished = sorted([item for item in active if item[0][2] <= starts[-1]],key=lambda item: item[0][2])
+					active = [item for item in active if item[0][2] > starts[-1]]
+					
+					for item in finished:
+						item[1].summarize_stats()
+						yield item
+			
+			# The remaining masked regions are finished as well
+			while(waiting < len(regions)):
+				active.append((regions[waiting],self.get_parser(regions[waiting])))
+				waiting += 1
+			
+			for item in sorted(active,key=lambda item: item[0][2]):
+				item[1].summarize_stats()
+				yield item
+	
+	def get_parser(self,region):
+		aligned_reads = BAMParser(region[0],region[1],region[2],self.alignment_pool,self.verbosity)
+		aligned_reads.set_max_depth(self.max_depth)
+		aligned_reads.reset()
+		
+		return aligned_reads
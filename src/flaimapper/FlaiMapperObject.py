@@ -37,53 +37,480 @@
 """
 
 
-import os,re,random,operator,argparse,sys
+import os,re,random,operator,argparse,sys,multiprocessing,zlib
 
 
 from flaimapper.BAMParser import BAMParser
+from flaimapper.BAMFilePool import BAMFilePool, index_alignments
+from flaimapper.BAMSweeper import BAMSweeper
 from flaimapper.SSLMParser import SSLMParser
 from flaimapper.FragmentContainer import FragmentContainer
 from flaimapper.FragmentFinder import FragmentFinder
+from flaimapper.FragmentFinderBatch import FragmentFinderBatch
 
 
 class FlaiMapperObject(FragmentContainer):
+	batch_size = 256													# Number of masked regions of which the fragments are detected at once
+	batch_length = 4 * 1024 * 1024										# Maximal total length of the masked regions in a batch
+	
 	def __init__(self,input_format,verbosity):
 		self.verbosity = verbosity
 		
 		self.input_format = input_format
 		self.alignments = []
+		self.alignment_pool = None
+		self.check_pool = None
+		
+		self.weight_tag = None
+		self.weight_from_name = False
+		
+		self.tile_size = 0
+		self.max_read_length = 150
+		
+		self.max_depth = 0
+		self.max_depth_check = 0.0
+		self.depth_report = []
 		
 		self.sequences = {}
+		self.stream = None
 		
 		if(self.verbosity == "verbose"):
 			print " - Initiated FlaiMapper Object"
 	
 	def add_alignment(self,alignment_file):
 		self.alignments.append(alignment_file)
+		
+		self.close_alignment_pools()
+	
+	def set_read_weights(self,weight_tag=None,weight_from_name=False):
+		"""Tells how to obtain the number of identical reads an alignment
+		represents, in case the reads in the BAM files were collapsed.
+		
+		----
+		@param weight_tag: BAM tag (e.g. 'XC') that contains the number
+		@param weight_from_name: parse the number from a '_x123' suffix
+		 of the read names
+		"""
+		self.weight_tag = weight_tag
+		self.weight_from_name = weight_from_name
+		
+		self.close_alignment_pools()
+	
+	def set_tiling(self,tile_size,max_read_length=150):
+		"""Masked regions longer than tile_size are split into tiles that
+		are processed independently, see get_tiles().
+		
+		----
+		@param tile_size: length of the tiles, 0 to disable tiling
+		@param max_read_length: the overlap of the tiles is based on
+		 this read length
+		"""
+		self.tile_size = tile_size
+		self.max_read_length = max_read_length
+	
+	def set_max_depth(self,max_depth,max_depth_check=0.0):
+		"""Downsamples masked regions with more than max_depth reads, see
+		MaskedRegion.set_max_depth(). The downsampled masked regions are
+		listed by write_depth_report().
+		
+		----
+		@param max_depth: maximal number of reads, 0 to disable
+		@param max_depth_check: fraction of the downsampled masked
+		 regions of which the fragments are also detected without
+		 downsampling, to report whether they differ
+		"""
+		self.max_depth = max_depth
+		self.max_depth_check = max_depth_check
+	
+	def close_alignment_pools(self):
+		for pool in [self.alignment_pool,self.check_pool]:
+			if(pool):
+				pool.close()
+		
+		self.alignment_pool = None
+		self.check_pool = None
+	
+	def get_alignment_pool(self):
+		"""Opens all BAM files once, so that the handles (and indices)
+		can be shared by all masked regions.
+		"""
+		if(not self.alignment_pool):
+			self.alignment_pool = BAMFilePool(self.alignments,self.verbosity,self.weight_tag,self.weight_from_name)
+		
+		return self.alignment_pool
+	
+	def get_aligned_reads(self,region):
+		"""
+		----
+		@return: parser of the reads in the masked region
+		"""
+		if(self.input_format == 'bam'):
+			aligned_reads = BAMParser(region[0],region[1],region[2],self.get_alignment_pool(),self.verbosity)
+		elif(self.input_format == 'sslm'):
+			aligned_reads = SSLMParser(region[0],region[1],region[2],self.alignments,self.verbosity)
+		
+		aligned_reads.set_max_depth(self.max_depth)
+		
+		return aligned_reads
 	
-	def run(self,regions,fasta_file):
+	def detect_fragments(self,region):
 		if(self.verbosity == "verbose"):
-			print " - Running fragment detection"
+			print "   - Masked region: "+region[0]+":"+str(region[1])+"-"+str(region[2])
+			print "     * Acquiring statistics"
 		
-		self.fasta_file = fasta_file
+		aligned_reads = self.get_aligned_reads(region)
+		aligned_reads.parse_stats()
 		
+		if(self.verbosity == "verbose"):
+			print "     * Detecting fragments"
+		
+		return FragmentFinder(region,aligned_reads)
+	
+	def detect_fragments_batch(self,regions):
+		"""Detects the fragments of multiple masked regions at once, see
+		FragmentFinderBatch.
+		"""
+		batch = []
 		for region in regions:
 			if(self.verbosity == "verbose"):
 				print "   - Masked region: "+region[0]+":"+str(region[1])+"-"+str(region[2])
 				print "     * Acquiring statistics"
 			
-			if(self.input_format == 'bam'):
-				aligned_reads = BAMParser(region[0],region[1],region[2],self.alignments,self.verbosity)
-			elif(self.input_format == 'sslm'):
-				aligned_reads = SSLMParser(region[0],region[1],region[2],self.alignments,self.verbosity)
-			
+			aligned_reads = self.get_aligned_reads(region)
 			aligned_reads.parse_stats()
-			
+			batch.append((region,aligned_reads))
+		
+		return self.detect_fragments_parsed(batch)
+	
+	def sweep_fragments(self,regions):
+		"""Detects the fragments of masked regions located on the same
+		reference sequence, using a single pass over the BAM files.
+		"""
+		batch = []
+		length = 0
+		for region,aligned_reads in BAMSweeper(self.get_alignment_pool(),self.verbosity,self.max_depth).sweep(regions):
 			if(self.verbosity == "verbose"):
-				print "     * Detecting fragments"
+				print "   - Masked region: "+region[0]+":"+str(region[1])+"-"+str(region[2])
+			
+			batch.append((region,aligned_reads))
+			length += len(aligned_reads.start_positions)
+			if(len(batch) == self.batch_size or length >= self.batch_length):
+				for predicted_fragments in self.detect_fragments_parsed(batch):
+					yield predicted_fragments
+				batch = []
+				length = 0
+		
+		for predicted_fragments in self.detect_fragments_parsed(batch):
+			yield predicted_fragments
+	
+	def detect_fragments_parsed(self,batch):
+		"""
+		----
+		@param batch: list of (masked region, MaskedRegion) tuples of
+		 which the statistics have been parsed
+		"""
+		if(self.verbosity == "verbose" and len(batch) > 0):
+			print "   - Detecting fragments in "+str(len(batch))+" masked region(s)"
+		
+		finders = FragmentFinderBatch().run(batch)
+		
+		for finder in finders:
+			if(finder.downsampling is not None):
+				finder.downsampling += (self.check_downsampling(finder),)
+		
+		return finders
+	
+	def check_downsampling(self,predicted_fragments):
+		"""Detects the fragments of a downsampled masked region again,
+		without downsampling, for a deterministic selection of
+		max_depth_check of the downsampled masked regions.
+		
+		----
+		@return: None if the masked region was not selected, otherwise
+		 whether the fragments are identical
+		@rtype: bool
+		"""
+		region = predicted_fragments.masked_region
+		
+		if((zlib.crc32(str(region[:3]) + str(region[5])) & 0xffffffff) >= self.max_depth_check * 2 ** 32):
+			return None
+		
+		if(self.verbosity == "verbose"):
+			print "   - Checking downsampled masked region: "+region[0]+":"+str(region[1])+"-"+str(region[2])
+		
+		if(self.input_format == 'bam'):
+			# Separate handles, the BAMSweeper may be streaming the others
+			if(not self.check_pool):
+				self.check_pool = BAMFilePool(self.alignments,self.verbosity,self.weight_tag,self.weight_from_name)
+			
+			aligned_reads = BAMParser(region[0],region[1],region[2],self.check_pool,self.verbosity)
+		else:
+			aligned_reads = self.get_aligned_reads(region)
+			aligned_reads.set_max_depth(0)
+		
+		aligned_reads.parse_stats()
+		
+		exact_fragments = FragmentFinder(region,aligned_reads)
+		
+		return [(fragment['start'],fragment['stop']) for fragment in predicted_fragments.results] == [(fragment['start'],fragment['stop']) for fragment in exact_fragments.results]
+	
+	def get_batches(self,regions,batch_size):
+		"""Groups the masked regions into batches of at most batch_size
+		regions and at most batch_length positions (unless a single
+		region is longer).
+		"""
+		batches = []
+		batch = []
+		length = 0
+		
+		for region in regions:
+			if(len(batch) > 0 and (len(batch) == batch_size or length + region[2] - region[1] + 1 > self.batch_length)):
+				batches.append(batch)
+				batch = []
+				length = 0
 			
-			predicted_fragments = FragmentFinder(region,aligned_reads)
+			batch.append(region)
+			length += region[2] - region[1] + 1
+		
+		if(len(batch) > 0):
+			batches.append(batch)
+		
+		return batches
+	
+	def get_tiles(self,regions):
+		"""Splits the masked regions that are longer than tile_size into
+		overlapping tiles, which are processed like masked regions.
+		
+		A tile only provides reliable statistics at some distance from
+		its borders: the stop positions near its start miss the reads
+		that start before the tile, and peaks are filtered and traced
+		within 15 positions. Tiles therefore overlap by twice the
+		maximal read length plus a multiple of these 15 positions. Each
+		tile is responsible for the peaks in its core, which ends
+		halfway the overlap with the next tile.
+		
+		----
+		@param regions: masked regions as returned by parse_gff()
+		
+		@return: the masked regions in which the long masked regions are
+		 replaced by their tiles and {tile: (masked region, first
+		 position of the core, last position of the core, number of
+		 tiles)}
+		@rtype: tuple
+		"""
+		overlap = 2 * (self.max_read_length + 5 * FragmentFinder.pmatrix_size)
+		tile_size = max(self.tile_size,2 * overlap)
+		step = tile_size - overlap
+		
+		tiled_regions = []
+		tiles = {}
+		
+		for region in regions:
+			if(region[2] - region[1] + 1 <= tile_size):
+				tiled_regions.append(region)
+			else:
+				starts = range(region[1],region[2] - overlap + 1,step)
+				
+				for i in range(len(starts)):
+					tile = (region[0],starts[i],min(starts[i] + tile_size - 1,region[2])) + region[3:]
+					
+					if(i == 0):
+						first = None
+					else:
+						first = starts[i] + (overlap / 2)
+					
+					if(i == len(starts) - 1):
+						last = None
+					else:
+						last = starts[i + 1] + (overlap / 2) - 1
+					
+					tiled_regions.append(tile)
+					tiles[tile] = (region,first,last,len(starts))
+		
+		return (tiled_regions,tiles)
+	
+	def add_tile_fragments(self,predicted_fragments,tiles,stitched):
+		"""Adds the fragments detected in a masked region, or collects
+		the peaks of a tile.
+		
+		The peaks are stitched rather than the fragments, because the
+		neighbour peak filter and the tracing of the fragments depend on
+		all peaks in the masked region. Each tile contributes the peaks
+		in its core, together with the median read lengths at these
+		positions. As soon as all tiles of a masked region are finished,
+		the peaks are filtered and the fragments are traced exactly like
+		they would have been without tiling.
+		
+		----
+		@param predicted_fragments: FragmentFinder of a masked region or tile
+		@param tiles: as returned by get_tiles()
+		@param stitched: {masked region: [remaining tiles, start peaks,
+		 stop peaks]} of the tiled masked regions that are not finished
+		"""
+		if(predicted_fragments.downsampling is not None):
+			self.depth_report.append((predicted_fragments.masked_region,) + predicted_fragments.downsampling)
+		
+		if(not tiles.has_key(predicted_fragments.masked_region)):
 			self.add_fragments(predicted_fragments,self.fasta_file)
+		else:
+			region,first,last,n = tiles[predicted_fragments.masked_region]
+			
+			if(not stitched.has_key(region)):
+				stitched[region] = [n,[],[]]
+			
+			for peaks,plist,avg_lengths in [(stitched[region][1],predicted_fragments.peaksStart,predicted_fragments.positions['startAvgLengths']),(stitched[region][2],predicted_fragments.peaksStop,predicted_fragments.positions['stopAvgLengths'])]:
+				for position,height in plist.iteritems():
+					if((first == None or position >= first) and (last == None or position <= last)):
+						# (position, height, median read length)
+						peaks.append((position,height,avg_lengths[position - predicted_fragments.offset]))
+			
+			stitched[region][0] -= 1
+			if(stitched[region][0] == 0):
+				self.add_fragments(self.trace_tiled_fragments(region,stitched[region][1],stitched[region][2]),self.fasta_file)
+				del(stitched[region])
+	
+	def trace_tiled_fragments(self,region,start_peaks,stop_peaks):
+		"""
+		----
+		@param start_peaks: list of (position, height, median read
+		 length) tuples of the start positions, see add_tile_fragments()
+		@param stop_peaks: the same for the stop positions
+		
+		@return: FragmentFinder with the fragments of the masked region
+		"""
+		predicted_fragments = FragmentFinder(region,None,False)
+		predicted_fragments.offset = region[1]
+		
+		traced = []
+		for peaks in [sorted(start_peaks),sorted(stop_peaks)]:
+			plist = dict([(peak[0],peak[1]) for peak in peaks])		# Inserted in order of position, like get_peaks()
+			avg_lengths = dict([(peak[0] - predicted_fragments.offset,peak[2]) for peak in peaks])
+			
+			traced.append((plist,predicted_fragments.correctNeighbourPeaks(plist),avg_lengths))
+		
+		predicted_fragments.peaksStart,predicted_fragments.correctedPeaksStart,start_avg_lengths = traced[0]
+		predicted_fragments.peaksStop,predicted_fragments.correctedPeaksStop,stop_avg_lengths = traced[1]
+		
+		predicted_fragments.results = predicted_fragments.find_fragments(predicted_fragments.correctedPeaksStart,predicted_fragments.correctedPeaksStop,start_avg_lengths,stop_avg_lengths,genomic_offset_masked_region=predicted_fragments.offset)
+		
+		return predicted_fragments
+	
+	def get_regions_per_reference(self,regions):
+		references = []
+		index = {}
+		
+		for region in regions:
+			if(not index.has_key(region[0])):
+				index[region[0]] = []
+				references.append(region[0])
+			
+			index[region[0]].append(region)
+		
+		return [index[reference] for reference in references]
+	
+	def run(self,regions,fasta_file,threads=1,sweep=False):
+		"""Detects the fragments in all masked regions.
+		
+		Missing or outdated BAM indices are built before the detection
+		starts. If more than one thread is requested, the regions are
+		distributed over a pool of worker processes. Each worker has
+		its own alignment handles and the results are collected in the
+		same order as the regions are provided.
+		
+		In sweep mode (BAM only) the reads are not fetched per masked
+		region, but each reference sequence is parsed only once, see
+		BAMSweeper. The workers then process entire reference sequences.
+		
+		The fragments are detected in batches of masked regions, see
+		FragmentFinderBatch.
+		
+		If tiling is enabled (see set_tiling()) long masked regions are
+		split into overlapping tiles. These are processed independently,
+		like masked regions, to bound the memory usage. Their peaks are
+		stitched together afterwards, see add_tile_fragments().
+		
+		If the results are streamed in order (see open_stream()), the
+		masked regions are processed in the order in which they are
+		written.
+		
+		----
+		@param regions: masked regions as returned by parse_gff()
+		@param fasta_file: pysam Fastafile used for exporting sequences
+		@param threads: number of worker processes
+		@param sweep: use the BAMSweeper instead of fetching regions
+		"""
+		if(self.verbosity == "verbose"):
+			print " - Running fragment detection"
+		
+		self.fasta_file = fasta_file
+		
+		if(self.input_format == 'bam'):
+			if(index_alignments(self.alignments,threads,self.verbosity)):
+				self.close_alignment_pools()
+		else:
+			sweep = False
+		
+		if(self.stream is not None):
+			regions = sorted(regions,key=lambda region: (region[0],region[5]))
+		
+		tiles = {}
+		stitched = {}
+		if(self.tile_size > 0):
+			regions,tiles = self.get_tiles(regions)
+		
+		if(sweep):
+			tasks = self.get_regions_per_reference(regions)
+			worker = sweep_fragments_worker
+		else:
+			# Keep enough batches to distribute over the workers
+			if(threads > 1):
+				batch_size = max(1,min(self.batch_size,len(regions) / (threads * 4)))
+			else:
+				batch_size = self.batch_size
+			
+			tasks = self.get_batches(regions,batch_size)
+			worker = detect_fragments_worker
+		
+		if(threads > 1):
+			pool = multiprocessing.Pool(threads,initializer=init_worker,initargs=(self.input_format,self.alignments,self.verbosity,self.weight_tag,self.weight_from_name,self.max_depth,self.max_depth_check))
+			chunksize = max(1,min(64,len(tasks) / (threads * 4)))
+			
+			try:
+				for results in pool.imap(worker,tasks,chunksize):
+					for predicted_fragments in results:
+						self.add_tile_fragments(predicted_fragments,tiles,stitched)
+				pool.close()
+			except:
+				pool.terminate()
+				raise
+			finally:
+				pool.join()
+		else:
+			for task in tasks:
+				if(sweep):
+					results = self.sweep_fragments(task)
+				else:
+					results = self.detect_fragments_batch(task)
+				
+				for predicted_fragments in results:
+					self.add_tile_fragments(predicted_fragments,tiles,stitched)
+	
+	def write_depth_report(self,filename):
+		"""Writes a table of the downsampled masked regions (or tiles),
+		see set_max_depth().
+		
+		----
+		@param filename: output filename; '-' for stdout
+		"""
+		fh = self.open_output(filename)
+		
+		fh.write("Reference sequence\tStart\tEnd\tAlignments\tSampled alignments\tScale\tExact check\n")
+		
+		checks = {None:"not checked",True:"identical",False:"different"}
+		for region,alignments,sampled,scale,check in sorted(self.depth_report,key=lambda item: (item[0][0],item[0][1],item[0][2])):
+			fh.write(region[0]+"\t"+str(region[1])+"\t"+str(region[2])+"\t"+str(alignments)+"\t"+str(sampled)+"\t"+str(scale)+"\t"+checks[check]+"\n")
+		
+		fh.close()
 	
 	def count_reads_per_region_custom_table(self,regions,links,all_predicted_fragments,reference_offset=0):
 		"""
@@ -240,15 +667,11 @@ class FlaiMapperObject(FragmentContainer):
 				
 				annotations = regions.index[links[ncRNA]]
 				
-				if(self.input_format == 'bam'):
-					aligned_reads = BAMParser(region[0],region[1],region[2],self.alignments,self.verbosity)
-				elif(self.input_format == 'sslm'):
-					aligned_reads = SSLMParser(region[0],region[1],region[2],self.alignments,self.verbosity)
+				aligned_reads = self.get_aligned_reads(region)
 				
 				aligned_reads.parse_stats()
 				
 				predicted_fragments_obj = FragmentFinder(ncRNA,aligned_reads)
-				predicted_fragments_obj.run()
 				
 				predicted_fragments = predicted_fragments_obj.results
 				
@@ -319,15 +742,11 @@ class FlaiMapperObject(FragmentContainer):
 				
 				annotations = regions.index[links[ncRNA]]
 				
-				if(self.input_format == 'bam'):
-					aligned_reads = BAMParser(region[0],region[1],region[2],self.alignments,self.verbosity)
-				elif(self.input_format == 'sslm'):
-					aligned_reads = SSLMParser(region[0],region[1],region[2],self.alignments,self.verbosity)
+				aligned_reads = self.get_aligned_reads(region)
 				
 				aligned_reads.parse_stats()
 				
 				predicted_fragments_obj = FragmentFinder(ncRNA,aligned_reads)
-				predicted_fragments_obj.run()
 				predicted_fragments = predicted_fragments_obj.getResults()
 				
 				aligned_reads.count_reads_per_region(predicted_fragments_obj.getResults())
@@ -336,7 +755,7 @@ class FlaiMapperObject(FragmentContainer):
 					closest_fragment = self.find_closest_overlapping_fragment(mirna_annotation,predicted_fragments,reference_offset)
 					
 					if(closest_fragment):
-						errors = self.find_errors(mirna_annotation,[(closest_fragment.start - reference_offset), (closest_fragment.stop - reference_offset)])#@todo ,reference_offset
+						errors = self.find_errors(mirna_annotation,closest_fragment,reference_offset)
 						err_5p = errors[0]
 						err_3p = errors[1]
 						
@@ -377,8 +796,8 @@ class FlaiMapperObject(FragmentContainer):
 		
 		"""
 		
-		error_5p = predicted_fragment.start - annotated_fragment.start - reference_offset
-		error_3p = predicted_fragment.stop - annotated_fragment.stop - reference_offset
+		error_5p = predicted_fragment['start'] - annotated_fragment['start'] - reference_offset
+		error_3p = predicted_fragment['stop'] - annotated_fragment['stop'] - reference_offset
 		
 		return [error_5p,error_3p]
 	
@@ -397,10 +816,7 @@ class FlaiMapperObject(FragmentContainer):
 			if(self.verbosity == "verbose"):
 				print "   - Masked region: "+region[0]+":"+str(region[1])+"-"+str(region[2])
 			
-			if(self.input_format == 'bam'):
-				aligned_reads = BAMParser(region[0],region[1],region[2],self.alignments,self.verbosity)
-			elif(self.input_format == 'sslm'):
-				aligned_reads = SSLMParser(region[0],region[1],region[2],self.alignments,self.verbosity)
+			aligned_reads = self.get_aligned_reads(region)
 			
 			for read_stacked in aligned_reads.parse_reads_stacked():
 				read = read_stacked[0]
@@ -428,16 +844,12 @@ class FlaiMapperObject(FragmentContainer):
 		# 1: write header
 		fh.write("@HD	VN:1.0	SO:unsorted\n")
 		for region in regions:
-			if(self.input_format == 'bam'):
-				aligned_reads = BAMParser(region[0],region[1],region[2],self.alignments,self.verbosity)
-			elif(self.input_format == 'sslm'):
-				aligned_reads = SSLMParser(region[0],region[1],region[2],self.alignments,self.verbosity)
+			aligned_reads = self.get_aligned_reads(region)
 			
-			iterator = aligned_reads.parse_reads()
-			if(next(iterator,None)):
+			if(aligned_reads.has_reads()):
 				fh.write("@SQ	SN:"+region[0]+"	LN:"+str(region[2] - region[1] + 1)+"\n")
 			
-			del(iterator,aligned_reads)
+			del(aligned_reads)
 		fh.write("@PG	ID:0	PN:manual_conversion_script	VN:0.0\n")
 		
 		# 2: write alignment
@@ -445,19 +857,37 @@ class FlaiMapperObject(FragmentContainer):
 			if(self.verbosity == "verbose"):
 				print "   - Masked region: "+region[0]+":"+str(region[1])+"-"+str(region[2])
 			
-			if(self.input_format == 'bam'):
-				aligned_reads = BAMParser(region[0],region[1],region[2],self.alignments,self.verbosity)
-			elif(self.input_format == 'sslm'):
-				aligned_reads = SSLMParser(region[0],region[1],region[2],self.alignments,self.verbosity)
+			aligned_reads = self.get_aligned_reads(region)
 			
-			for read in aligned_reads.parse_reads():
-				if(read.name):
-					fh.write(read.name)
-				else:
-					fh.write("unknown_read_"+str(i))
-					i += 1
-				
-				strand = "60"
-				fh.write("\t0\t"+region[0]+"\t"+str(read.start+1)+"\t"+strand+"\t"+str(read.stop - read.start)+"M\t*\t0\t0\t"+read.sequence+"\t*\tNH:i:1\n")
+			for read in aligned_reads.parse_reads(True):
+				for j in range(read.weight):
+					if(read.name):
+						fh.write(read.name)
+					else:
+						fh.write("unknown_read_"+str(i))
+						i += 1
+					
+					strand = "60"
+					fh.write("\t0\t"+region[0]+"\t"+str(read.start+1)+"\t"+strand+"\t"+str(read.stop - read.start)+"M\t*\t0\t0\t"+read.sequence+"\t*\tNH:i:1\n")
 		
 		fh.close()
+
+
+# Worker processes can not share the alignment handles of the parent
+# process, so every worker builds its own FlaiMapperObject once.
+_worker = None
+
+def init_worker(input_format,alignments,verbosity,weight_tag,weight_from_name,max_depth,max_depth_check):
+	global _worker
+	
+	_worker = FlaiMapperObject(input_format,verbosity)
+	_worker.set_read_weights(weight_tag,weight_from_name)
+	_worker.set_max_depth(max_depth,max_depth_check)
+	for alignment in alignments:
+		_worker.add_alignment(alignment)
+
+def detect_fragments_worker(regions):
+	return _worker.detect_fragments_batch(regions)
+
+def sweep_fragments_worker(regions):
+	return list(_worker.sweep_fragments(regions))
@@ -37,14 +37,23 @@
 """
 
 
-import os,re,random,operator,argparse,sys
+import os,re,random,operator,argparse,sys,tempfile
 import pysam
 
+from flaimapper.SequenceCache import SequenceCache
+from flaimapper.OutputWriter import OutputWriter
 
 
 class FragmentContainer(object):
+	sequence_cache_size = 16 * 1024 * 1024								# Maximal size in bytes of the reference sequences kept in memory, see SequenceCache
+	sequence_cache = None
+	output_threaded = False
+	
+	export_formats = {1:"tab-delimited, per fragment",2:"tab-delimited, per ncRNA",3:"gen-bank",4:"GTF",5:"GTF, relative to the masked regions",6:"BED"}
+	
 	def __init__(self,verbosity):
 		self.verbosity = verbosity
+		self.stream = None
 		
 	def add_fragments(self,flaimapperObj,fasta_file=None):
 		"""
@@ -52,6 +61,14 @@ class FragmentContainer(object):
 		----
 		@param flaimapperObj: 
 		"""
+		self.fasta_file = fasta_file
+		
+		if(self.stream is not None):
+			flaimapperObj.release_statistics()
+			self.stream['pending'][flaimapperObj.masked_region[5]] = flaimapperObj
+			self.flush_stream()
+			return
+		
 		for fragment in flaimapperObj.results:
 			if(flaimapperObj.name not in self.sequences.keys()):
 				self.sequences[flaimapperObj.name] = {}
@@ -61,6 +78,169 @@ class FragmentContainer(object):
 		#self.sequences[flaimapperObj.name][] = flaimapperObj
 		self.fasta_file = fasta_file
 	
+	def open_stream(self,outputs,regions,ordered=True):
+		"""Writes the fragments of each masked region as soon as they have
+		been detected, instead of keeping all results until export().
+		
+		If ordered, the masked regions are written in the same order as
+		export() does, i.e. sorted by name and by their order in the
+		mask. Results that arrive earlier are kept (without their
+		statistics) until all preceding masked regions have been
+		written. This only bounds the memory usage if the results arrive
+		in about the same order, which is not the case for the
+		BAMSweeper: it finishes the masked regions of a reference
+		sequence by their end position. Otherwise the masked regions are
+		written in the order in which they arrive. GTF and BED features
+		are collected and sorted when the stream is closed.
+		
+		----
+		@param outputs: list of (export format, output filename) tuples,
+		 see open_sinks(); GenBank is not supported
+		@param regions: all masked regions that will be detected, as
+		 returned by parse_gff()
+		@param ordered: write the masked regions in the order of export()
+		"""
+		for export_format,output_filename in outputs:
+			if(export_format == 3):
+				raise ValueError("Streaming is not supported for the GenBank format (3)")
+		
+		if(ordered):
+			order = sorted(set([(region[0],region[5]) for region in regions]))
+		else:
+			order = None
+		
+		self.stream = {'sinks':self.open_sinks(outputs),'order':order,'next':0,'pending':{}}
+	
+	def flush_stream(self,finished=False):
+		"""Writes the pending results of the masked regions that are next
+		in line.
+		
+		----
+		@param finished: also skip masked regions that have no results
+		"""
+		stream = self.stream
+		
+		written = False
+		
+		if(stream['order'] is None):
+			for masked_region_id in sorted(stream['pending'].keys()):
+				flaimapperObj = stream['pending'].pop(masked_region_id)
+				if(flaimapperObj.results):
+					self.write_sinks(stream['sinks'],flaimapperObj.name,flaimapperObj.results)
+					written = True
+		else:
+			while(stream['next'] < len(stream['order'])):
+				name,masked_region_id = stream['order'][stream['next']]
+				
+				if(stream['pending'].has_key(masked_region_id)):
+					flaimapperObj = stream['pending'].pop(masked_region_id)
+					if(flaimapperObj.results):
+						self.write_sinks(stream['sinks'],name,flaimapperObj.results)
+						written = True
+				elif(not finished):
+					break
+				
+				stream['next'] += 1
+		
+		# Make the written masked regions visible, e.g. in a pipe
+		if(written):
+			for sink in stream['sinks']:
+				if(sink['fh'] is not None):
+					sink['fh'].flush()
+	
+	def close_stream(self):
+		self.flush_stream(True)
+		self.close_sinks(self.stream['sinks'])
+		
+		self.stream = None
+	
+	def open_sinks(self,outputs):
+		"""Opens the outputs to which the results of each masked region
+		are written by write_sinks(), so that several formats can be
+		exported with a single traversal of the results.
+		
+		----
+		@param outputs: list of (export format, output filename) tuples,
+		 see export_formats
+		
+		@return: the sinks, which have to be closed with close_sinks()
+		@rtype: list
+		"""
+		for export_format,output_filename in outputs:
+			if(not self.export_formats.has_key(export_format)):
+				raise ValueError("Unknown export format: "+str(export_format)+" (choose from: "+", ".join([str(key) for key in sorted(self.export_formats)])+")")
+		
+		sinks = []
+		for export_format,output_filename in outputs:
+			if(self.verbosity == "verbose"):
+				print " - Exporting results to: "+output_filename
+			print "   - Format: "+self.export_formats[export_format]
+			
+			sink = {'format':export_format,'filename':output_filename,'fh':None,'features':[]}
+			
+			if(export_format == 1):
+				sink['fh'] = self.open_output(output_filename)
+				self.write_table__per_fragment_header(sink['fh'])
+			elif(export_format == 2):
+				sink['fh'] = self.open_output(output_filename)
+				self.write_table__per_ncRNA_header(sink['fh'])
+			
+			sinks.append(sink)
+		
+		return sinks
+	
+	def write_sinks(self,sinks,name,result):
+		"""Writes the fragments of a single masked region to all sinks.
+		The tables are written directly, GTF and BED features are
+		collected to be sorted by close_sinks().
+		"""
+		for sink in sinks:
+			if(sink['format'] == 1):
+				self.write_table__per_fragment(sink['fh'],name,result)
+			elif(sink['format'] == 2):
+				self.write_table__per_ncRNA(sink['fh'],name,result)
+			elif(sink['format'] in [4,5,6]):
+				sink['features'].extend(self.get_features(sink['format'],name,result))
+	
+	def close_sinks(self,sinks):
+		for sink in sinks:
+			if(sink['fh'] is not None):
+				sink['fh'].close()
+			elif(sink['format'] == 3):
+				self.export_genbank(sink['filename'])			# Needs all results at once
+			elif(sink['format'] == 6):
+				self.export_features(sink['filename'],sink['features'],"bed")
+			else:
+				self.export_features(sink['filename'],sink['features'],"gff")
+	
+	def export(self,outputs):
+		"""Exports the discovered fragments to one or more outputs, with a
+		single traversal of the results.
+		
+		----
+		@param outputs: list of (export format, output filename) tuples,
+		 see export_formats
+		
+		@return: success
+		@rtype: boolean
+		"""
+		if(not self.sequences):
+			print "     * Warning: no fragments detected"
+			return False
+		
+		sinks = self.open_sinks(outputs)
+		
+		for name in sorted(self.sequences.keys()):
+			for masked_region_id in sorted(self.sequences[name]):
+				result = self.sequences[name][masked_region_id].results
+				
+				if(result):
+					self.write_sinks(sinks,name,result)
+		
+		self.close_sinks(sinks)
+		
+		return True
+	
 	def export_genbank(self,filenamePrefix,suffixes=['_grouped.gbk','_single.gbk'],loffset = -3,roffset = 5):
 		"""Write discovered fragments to genbank format (2 files). Certain arguments are created arbitrary just to make them non-empty.
 		
@@ -83,8 +263,8 @@ class FragmentContainer(object):
 			if(filenamePrefix == "-"):
 				print "Currently stdout is not supported for genbank"
 			
-			fh_grouped = open(filenamePrefix+suffixes[0],'w')
-			fh_single = open(filenamePrefix+suffixes[1],'w')
+			fh_grouped = self.open_output(filenamePrefix+suffixes[0])
+			fh_single = self.open_output(filenamePrefix+suffixes[1])
 			
 			for name in sorted(self.sequences.keys()):
 				for masked_region_id in sorted(self.sequences[name]):
@@ -145,35 +325,24 @@ class FragmentContainer(object):
 		@return: success
 		@rtype: boolean
 		"""
-		if(not self.sequences):
-			return False												# Raise error?
-		else:
-			if(filename == "-"):
-				fh = sys.stdout
-			else:
-				fh = open(filename,'w')
-			
-			fh.write("NAME\tCurated\tUnreliable")
-			
-			for i in range(0,25):
-				letter = chr(ord('A')+i)
-				fh.write("\tFragment-"+letter+"-Start\tFragment-"+letter+"-Stop\tFragment-"+letter+"-Sequence")
-			
-			fh.write("\n")
-			
-			for name in sorted(self.sequences.keys()):
-				for masked_region_id in sorted(self.sequences[name]):
-					result = self.sequences[name][masked_region_id].results
-					if(result):
-						row = name+"\tNo\t?"
-						
-						for fragment in result:
-							row += "\t"+str(fragment['start'])+"\t"+str(fragment['stop'])+"\t"+str(fragment['sequence'])
-						
-						fh.write(row+"\n")
+		return self.export([(2,filename)])
+	
+	def write_table__per_ncRNA_header(self,fh):
+		fh.write("NAME\tCurated\tUnreliable")
 		
-		fh.close
-		return True
+		for i in range(0,25):
+			letter = chr(ord('A')+i)
+			fh.write("\tFragment-"+letter+"-Start\tFragment-"+letter+"-Stop\tFragment-"+letter+"-Sequence")
+		
+		fh.write("\n")
+	
+	def write_table__per_ncRNA(self,fh,name,result):
+		row = name+"\tNo\t?"
+		
+		for fragment in result:
+			row += "\t"+str(fragment['start'])+"\t"+str(fragment['stop'])+"\t"+str(fragment['sequence'])
+		
+		fh.write(row+"\n")
 	
 	def export_table__per_fragment(self,filename):
 		"""Exports the discovered fragments to a tab-delimited file.
@@ -186,97 +355,230 @@ class FragmentContainer(object):
 		@return:
 		@rtype:
 		"""
-		if(not self.sequences):
-			print "     * Warning: no fragments detected"
-		else:
-			if(filename == "-"):
-				fh = sys.stdout
+		return self.export([(1,filename)])
+	
+	def write_table__per_fragment_header(self,fh):
+		fh.write("Fragment\tSize\tReference sequence\tStart\tEnd\tPrecursor\tStart in precursor\tEnd in precursor\tSequence\tCorresponding-reads (start)\tCorresponding-reads (end)\tCorresponding-reads (total)\n")
+	
+	def write_table__per_fragment(self,fh,name,result):
+		"""Writes the fragments of a single masked region, see
+		export_table__per_fragment().
+		
+		The sequence of the masked region is taken from the SequenceCache
+		(unless it would not fit), and the sequences of the fragments are
+		sliced from it.
+		"""
+		if(self.fasta_file):
+			masked_region = result[0].masked_region
+			span_start = min([masked_region[1]] + [fragment['start'] for fragment in result])
+			span_stop = max([masked_region[2]] + [fragment['stop'] for fragment in result]) + 1
+			
+			if(span_stop - span_start <= self.sequence_cache_size):
+				span = self.get_sequence_cache().fetch(name,span_start,span_stop)
 			else:
-				fh = open(filename,'w')
+				span = None
+		
+		for i,fragment in self.get_numbered_fragments(result):
+			# Fragment uid
+			fh.write(self.get_fragment_uid(name,fragment,i) + "\t")
 			
-			fh.write("Fragment\tSize\tReference sequence\tStart\tEnd\tPrecursor\tStart in precursor\tEnd in precursor\tSequence\tCorresponding-reads (start)\tCorresponding-reads (end)\tCorresponding-reads (total)\n")
+			# Size
+			fh.write(str(fragment['stop'] - fragment['start'] + 1) + "\t")
 			
-			for name in sorted(self.sequences.keys()):
-				for masked_region_id in sorted(self.sequences[name]):
-					result = self.sequences[name][masked_region_id].results
-					
-					if(result):
-						fragments_sorted_keys = {}
-						for fragment in result:
-							fragments_sorted_keys[fragment['start']] = fragment
-						
-						i = 0
-						for key in sorted(fragments_sorted_keys.keys()):	# Walk over i in the for-loop:
-							i += 1
-							fragment = fragments_sorted_keys[key]
-							
-							# Fragment uid
-							if(fragment.masked_region[4]):
-								fh.write(fragment.masked_region[4] + "_")
-							
-							if(name != fragment.masked_region[4]):
-								fh.write(name + "_")
-							
-							fh.write("Fragment_" + str(i) + "\t")
-							
-							# Size
-							fh.write(str(fragment['stop'] - fragment['start'] + 1) + "\t")
-							
-							# Reference sequence 
-							fh.write(name + "\t")
-							
-							# Start
-							fh.write(str(fragment['start']) + "\t")
-							
-							# End
-							fh.write(str(fragment['stop'])+"\t")
-							
-							# Precursor
-							if(fragment.masked_region[4]):
-								fh.write(fragment.masked_region[4])
-							elif(fragment.masked_region[1] == 0):
-								fh.write(name)
-							elif(fragment.masked_region[1] != 0):
-								print "     * Warning: masked region in the GTF/GFF file has no annotated gene name - please set the gene_id='gene-name' tag"
-							
-							# Start in precursor
-							fh.write("\t" + str(fragment['start']-fragment.masked_region[1])+ "\t")
-							
-							# End in precursor
-							fh.write(str(fragment['stop']-fragment.masked_region[1])+"\t")
-							
-							# Sequence 
-							if(self.fasta_file):
-								# PySam 0.8.2 claims to use 0-based coordinates pysam.FastaFile.fetch().
-								# This is only true for the start position, the end-position is 1-based.
-								fh.write(str(self.fasta_file.fetch(name,fragment['start'],fragment['stop']+1)))
-							
-							# Start supporting reads
-							fh.write("\t"+str(fragment['start_supporting_reads'])+"\t")
-							
-							# Stop supporting reads
-							fh.write(str(fragment['stop_supporting_reads'])+"\t")
-							
-							# Total supporting reads
-							fh.write(str(fragment['stop_supporting_reads']+fragment['start_supporting_reads']) + "\n")
+			# Reference sequence 
+			fh.write(name + "\t")
+			
+			# Start
+			fh.write(str(fragment['start']) + "\t")
+			
+			# End
+			fh.write(str(fragment['stop'])+"\t")
+			
+			# Precursor
+			if(fragment.masked_region[4]):
+				fh.write(fragment.masked_region[4])
+			elif(fragment.masked_region[1] == 0):
+				fh.write(name)
+			elif(fragment.masked_region[1] != 0):
+				print "     * Warning: masked region in the GTF/GFF file has no annotated gene name - please set the gene_id='gene-name' tag"
+			
+			# Start in precursor
+			fh.write("\t" + str(fragment['start']-fragment.masked_region[1])+ "\t")
+			
+			# End in precursor
+			fh.write(str(fragment['stop']-fragment.masked_region[1])+"\t")
 			
-			fh.close()
+			# Sequence 
+			if(self.fasta_file):
+				# PySam 0.8.2 claims to use 0-based coordinates pysam.FastaFile.fetch().
+				# This is only true for the start position, the end-position is 1-based.
+				if(span is not None):
+					fh.write(span[fragment['start'] - span_start:fragment['stop'] + 1 - span_start])
+				else:
+					fh.write(str(self.fasta_file.fetch(name,fragment['start'],fragment['stop']+1)))
+			
+			# Start supporting reads
+			fh.write("\t"+str(fragment['start_supporting_reads'])+"\t")
+			
+			# Stop supporting reads
+			fh.write(str(fragment['stop_supporting_reads'])+"\t")
+			
+			# Total supporting reads
+			fh.write(str(fragment['stop_supporting_reads']+fragment['start_supporting_reads']) + "\n")
+	
+	def set_output_thread(self,threaded):
+		"""Compress and write the output files in a separate thread, see
+		OutputWriter.
+		"""
+		self.output_threaded = threaded
+	
+	def open_output(self,filename):
+		"""
+		----
+		@param filename: output filename; '-' for stdout, compressed if
+		 it ends with '.gz' (gzip) or '.bgz' (bgzip)
+		
+		@return: buffered output file
+		@rtype: OutputWriter
+		"""
+		return OutputWriter(filename,self.output_threaded)
+	
+	def get_numbered_fragments(self,result):
+		"""
+		----
+		@return: (number, fragment) tuples, numbered from 1 by their
+		 start position; of fragments with the same start only the last
+		 one is kept
+		@rtype: list
+		"""
+		fragments_sorted_keys = {}
+		for fragment in result:
+			fragments_sorted_keys[fragment['start']] = fragment
+		
+		return [(i + 1,fragments_sorted_keys[key]) for i,key in enumerate(sorted(fragments_sorted_keys.keys()))]
+	
+	def get_fragment_uid(self,name,fragment,i):
+		uid = ""
+		if(fragment.masked_region[4]):
+			uid += fragment.masked_region[4] + "_"
+		
+		if(name != fragment.masked_region[4]):
+			uid += name + "_"
+		
+		return uid + "Fragment_" + str(i)
+	
+	def get_precursor_name(self,name,fragment):
+		if(fragment.masked_region[4]):
+			return fragment.masked_region[4]
+		else:
+			return name
+	
+	def get_strand(self,fragment):
+		"""Fragments are located on the strand of their masked region."""
+		if(len(fragment.masked_region) > 6):
+			return fragment.masked_region[6]
+		else:
+			return "."
+	
+	def get_sequence_cache(self):
+		if(self.sequence_cache is None or self.sequence_cache.fasta_file is not self.fasta_file):
+			self.sequence_cache = SequenceCache(self.fasta_file,self.sequence_cache_size)
+		
+		return self.sequence_cache
 	
 	def export_gtf__relative_to_reference_sequence(self,filename):
-		pass
+		"""Exports the discovered fragments to a GTF file, with the
+		coordinates on the reference sequences. See export_features().
+		"""
+		return self.export([(4,filename)])
 	
 	def export_gtf__relative_to_masked_region(self,filename):
-		pass
+		"""Exports the discovered fragments to a GTF file, with the
+		coordinates relative to the precursors (masked regions). The
+		precursor names are used as reference sequence names.
+		"""
+		return self.export([(5,filename)])
+	
+	def export_bed(self,filename):
+		"""Exports the discovered fragments to a BED file, with the
+		coordinates on the reference sequences. See export_features().
+		"""
+		return self.export([(6,filename)])
+	
+	def get_features(self,export_format,name,result):
+		"""
+		----
+		@param export_format: 4 (GTF), 5 (GTF; relative to the masked
+		 region) or 6 (BED)
+		
+		@return: the features of the fragments of a masked region, see
+		 export_features()
+		@rtype: list
+		"""
+		features = []
+		for i,fragment in self.get_numbered_fragments(result):
+			if(export_format == 4):
+				features.append((name,fragment['start'] + 1,fragment['stop'] + 1,self.get_gtf_attributes(name,fragment,i),fragment))
+			elif(export_format == 5):
+				offset = fragment.masked_region[1]
+				features.append((self.get_precursor_name(name,fragment),fragment['start'] - offset + 1,fragment['stop'] - offset + 1,self.get_gtf_attributes(name,fragment,i),fragment))
+			else:
+				features.append((name,fragment['start'],fragment['stop'] + 1,self.get_fragment_uid(name,fragment,i),fragment))
+		
+		return features
+	
+	def get_gtf_attributes(self,name,fragment,i):
+		return 'gene_id "'+self.get_precursor_name(name,fragment)+'"; transcript_id "'+self.get_fragment_uid(name,fragment,i)+'"; start_supporting_reads "'+str(fragment['start_supporting_reads'])+'"; stop_supporting_reads "'+str(fragment['stop_supporting_reads'])+'";'
+	
+	def export_features(self,filename,features,preset):
+		"""Writes the fragments sorted by reference sequence and position.
+		If the filename ends with '.gz', the file is compressed with
+		bgzip and indexed with tabix, so that the fragments can be
+		queried by locus.
+		
+		----
+		@param filename: output filename; '-' for stdout
+		@param features: list of (reference sequence, start, end, name
+		 or attributes, fragment) tuples, with the coordinates of the
+		 file format
+		@param preset: "gff" for GTF or "bed" for BED
+		"""
+		if(filename != "-" and filename.endswith(".gz")):
+			# The file and its index are written to temporary files
+			# that replace the output only once both are complete
+			fd,uncompressed_filename = tempfile.mkstemp(suffix=".tmp",dir=os.path.dirname(os.path.abspath(filename)))
+			os.close(fd)
+			compressed_filename = uncompressed_filename+".gz"
+			
+			try:
+				self.write_features(uncompressed_filename,features,preset)
+				
+				if(self.verbosity == "verbose"):
+					print "   - Compressing (bgzip) and indexing (tabix): "+filename
+				
+				pysam.tabix_index(uncompressed_filename,force=True,preset=preset,index=compressed_filename+".tbi")
+				os.rename(compressed_filename+".tbi",filename+".tbi")
+				os.rename(compressed_filename,filename)
+			finally:
+				for temporary_filename in [uncompressed_filename,compressed_filename,compressed_filename+".tbi"]:
+					if(os.path.exists(temporary_filename)):
+						os.remove(temporary_filename)
+		else:
+			self.write_features(filename,features,preset)
+	
+	def write_features(self,filename,features,preset):
+		fh = self.open_output(filename)
+		
+		for reference,start,stop,description,fragment in sorted(features,key=lambda feature: feature[0:4]):
+			score = fragment['start_supporting_reads'] + fragment['stop_supporting_reads']
+			strand = self.get_strand(fragment)
+			
+			if(preset == "gff"):
+				fh.write(reference+"\tflaimapper\tsncdRNA\t"+str(start)+"\t"+str(stop)+"\t"+str(score)+"\t"+strand+"\t.\t"+description+"\n")
+			else:
+				fh.write(reference+"\t"+str(start)+"\t"+str(stop)+"\t"+description+"\t"+str(score)+"\t"+strand+"\n")
+		
+		fh.close()
 	
 	def write(self,export_format,output_filename):
-		if(self.verbosity == "verbose"):
-			print " - Exporting results to: "+output_filename
-		if(export_format == 1):
-			print "   - Format: tab-delimited, per fragment"
-			self.export_table__per_fragment(output_filename)
-		elif(export_format == 2):
-			print "   - Format: tab-delimited, per ncRNA"
-			self.export_table__per_ncRNA(output_filename)
-		elif(export_format == 3):
-			print "   - Format: gen-bank"
-			self.export_genbank(output_filename)
+		return self.export([(export_format,output_filename)])
@@ -37,7 +37,8 @@
 """
 
 
-import os,re,random,operator,argparse,sys
+import os,re,random,operator,argparse,sys,bisect
+import numpy
 
 from flaimapper.ncRNAfragment import ncRNAfragment
 
@@ -47,33 +48,90 @@ class FragmentFinder:
 	
 	@todo merge masked_region
 	"""
-	def __init__(self,masked_region,readcount,autorun=True):
+	engines = ["numpy","python"]
+	
+	# Neighbour peak filter: percentage of a peak below which the peak
+	# at a distance of -15 ... 15 positions is considered noise
+	pmatrix = {
+	-15 :0.00003726653,
+	-14 :0.0001866447,
+	-13 :0.008364835,
+	-12 :0.0354626,
+	-11 :0.1203860,
+	-10 :0.3865920,
+	 -9 :1.110900,
+	 -8 :2.856550,
+	 -7 :6.572853,
+	 -6 :13.53353,
+	 -5 :24.93522,
+	 -4 :100,
+	 -3 :100,
+	 -2 :100,
+	 -1 :100,
+	
+	  1 :100,
+	  2 :100,
+	  3 :100,
+	  4 :100,
+	  5 :24.93522,
+	  6 :13.53353,
+	  7 :6.572853,
+	  8 :2.856550,
+	  9 :1.110900,
+	 10 :0.3865920,
+	 11 :0.1203860,
+	 12 :0.0354626,
+	 13 :0.008364835,
+	 14 :0.0001866447,
+	 15 :0.00003726653 }
+	
+	pmatrix_size = 15
+	pmatrix_vector = [pmatrix.get(diff,0)/100.0 for diff in range(-pmatrix_size,pmatrix_size+1)]
+	
+	def __init__(self,masked_region,readcount,autorun=True,engine="numpy"):
 		"""
 		----
 		@param: name
 		@param: seq
 		@param: readcount
 		@param: autorun
+		@param engine: "numpy" for the vectorized peak detection or
+		 "python" for the original (reference) implementation
 		"""
 		
+		if(engine not in self.engines):
+			raise ValueError("Unknown engine: "+str(engine)+" (choose from: "+", ".join(self.engines)+")")
+		
+		self.engine = engine
 		self.masked_region = masked_region
 		self.name = masked_region[0]
 		
+		self.downsampling = None										# See MaskedRegion.finish_sampling()
+		
 		if(autorun):
-			self.positions = {}
-			self.positions['startPositions'] = readcount.start_positions
-			self.positions['stopPositions'] = readcount.stop_positions
-			self.positions['startAvgLengths'] = readcount.start_avg_lengths
-			self.positions['stopAvgLengths'] = readcount.stop_avg_lengths
-			
-			self.peaksStart = False
-			self.peaksStop = False
-			
-			self.correctedPeaksStart = False
-			self.correctedPeaksStop = False
-			
+			self.set_positions(readcount)
 			self.run()
+	
+	def set_positions(self,readcount):
+		"""
+		----
+		@param readcount: MaskedRegion of which the statistics have been parsed
+		"""
+		self.offset = readcount.origin									# Position in the reference sequence of the first position of the statistics
+		self.downsampling = readcount.downsampling
 		
+		self.positions = {}
+		self.positions['startPositions'] = readcount.start_positions
+		self.positions['stopPositions'] = readcount.stop_positions
+		self.positions['startAvgLengths'] = readcount.start_avg_lengths
+		self.positions['stopAvgLengths'] = readcount.stop_avg_lengths
+		
+		self.peaksStart = False
+		self.peaksStop = False
+		
+		self.correctedPeaksStart = False
+		self.correctedPeaksStop = False
+	
 	def findPeaks(self,plist,drop_cutoff=0.1):
 		"""
 		----
@@ -108,68 +166,121 @@ class FragmentFinder:
 			previous = current
 		return peaks
 	
+	def find_peaks(self,plist,drop_cutoff=0.1):
+		"""Vectorized version of findPeaks().
+		
+		Whenever the counts drop, the peak is the last position at which
+		they increased (the counts in between are equal) unless a drop
+		already took place in between. This only holds if no count is
+		negative and drop_cutoff <= 1, otherwise findPeaks() is used.
+		
+		----
+		@param plist: [start/stop]-position counts
+		@param drop_cutoff: see findPeaks()
+		
+		@return: positions and heights of the peaks, sorted by position
+		@rtype: tuple of two numpy arrays
+		"""
+		values = numpy.asarray(plist)
+		
+		if(drop_cutoff > 1 or (len(values) > 0 and values.min() < 0)):
+			peaks = self.findPeaks(values.tolist(),drop_cutoff)
+			positions = numpy.array(sorted(peaks.keys()),dtype=numpy.int64)
+			return positions,values[positions]
+		
+		steps = numpy.diff(numpy.concatenate(([0],values)))
+		rises = numpy.flatnonzero(steps > 0)
+		drops = numpy.flatnonzero(steps < 0)
+		
+		last_rise = numpy.searchsorted(rises,drops) - 1
+		previous_drop = numpy.concatenate(([-1],drops[:-1]))
+		
+		rising = last_rise >= 0
+		positions = rises[last_rise[rising]]
+		positions = positions[positions > previous_drop[rising]]
+		
+		return positions,values[positions]
+	
+	def get_peaks(self,plist):
+		"""Finds the peaks with the selected engine.
+		
+		The peaks are indexed by their position in the reference
+		sequence and inserted in order of position. Peaks of equal height
+		are visited in the iteration order of these dictionaries, which
+		therefore does not depend on where the statistics start.
+		
+		----
+		@param plist: numpy array with [start/stop]-position counts
+		
+		@return: {position: height}
+		@rtype: dictionary
+		"""
+		plist = numpy.append(plist,0)									# Allow a peak at the last position
+		
+		if(self.engine == "python"):
+			peaks = self.findPeaks(plist.tolist())
+			positions = sorted(peaks.keys())
+			heights = [peaks[pos] for pos in positions]
+		else:
+			positions,heights = self.find_peaks(plist)
+			positions = positions.tolist()
+			heights = heights.tolist()
+		
+		return dict(zip([pos + self.offset for pos in positions],heights))
+	
 	def correctNeighbourPeaks(self,plist):
 		"""
 		Smooth filtering
+		
+		The peaks are visited from high to low, each peak removes its
+		lower neighbours within the range of pmatrix. Only these
+		neighbours are visited, found by bisecting the sorted positions.
 		----
 		@return:
 		@rtype:
 		"""
 		
 		psorted = sorted(plist.iteritems(),key=operator.itemgetter(1))[::-1]
-		pmatrix = {
-		-15 :0.00003726653,
-		-14 :0.0001866447,
-		-13 :0.008364835,
-		-12 :0.0354626,
-		-11 :0.1203860,
-		-10 :0.3865920,
-		 -9 :1.110900,
-		 -8 :2.856550,
-		 -7 :6.572853,
-		 -6 :13.53353,
-		 -5 :24.93522,
-		 -4 :100,
-		 -3 :100,
-		 -2 :100,
-		 -1 :100,
-		
-		  1 :100,
-		  2 :100,
-		  3 :100,
-		  4 :100,
-		  5 :24.93522,
-		  6 :13.53353,
-		  7 :6.572853,
-		  8 :2.856550,
-		  9 :1.110900,
-		 10 :0.3865920,
-		 11 :0.1203860,
-		 12 :0.0354626,
-		 13 :0.008364835,
-		 14 :0.0001866447,
-		 15 :0.00003726653 }
+		positions = sorted(plist.keys())
 		
 		# There is a small mistake in the algorithm,
 		# it should search not for ALL peaks
 		# but only for ALL peaks except itself; position i can not be a noise product of i itself
 		
-		for i in range(len(psorted)):
-			if(psorted[i] != False):
-				item = psorted[i]
-				for j in range(len(psorted)):							# Can be limited to size and -size of pmatrix
-					if((psorted[j] != False) and (j != i)):
-						item2 = psorted[j]
-						diff = item2[0]-item[0]
-						if(pmatrix.has_key(diff)):
-							perc = pmatrix[diff]/100.0
-							if((perc*item[1]) > item2[1]):
-								psorted[j] = False
+		removed = set()
+		for item in psorted:
+			if(item[0] not in removed):
+				for j in range(bisect.bisect_left(positions,item[0]-self.pmatrix_size),bisect.bisect_right(positions,item[0]+self.pmatrix_size)):
+					pos = positions[j]
+					if((pos != item[0]) and (pos not in removed)):
+						perc = self.pmatrix_vector[pos-item[0]+self.pmatrix_size]
+						if((perc*item[1]) > plist[pos]):
+							removed.add(pos)
 		
 		pnew = {}
 		
 		for item in psorted:
-			if(item != False):
+			if(item[0] not in removed):
+				pnew[item[0]] = item[1]
+		
+		return pnew
+	
+	def select_peaks(self,plist,kept):
+		"""Returns the peaks that survive the neighbour peak filter, in
+		the same order as correctNeighbourPeaks() does, which matters
+		for ties in find_fragments().
+		
+		----
+		@param plist: {position: height} as returned by get_peaks()
+		@param kept: positions of the peaks that are kept
+		
+		@return: {position: height}
+		@rtype: dictionary
+		"""
+		pnew = {}
+		
+		for item in sorted(plist.iteritems(),key=operator.itemgetter(1))[::-1]:
+			if(item[0] in kept):
 				pnew[item[0]] = item[1]
 		
 		return pnew
@@ -179,68 +290,54 @@ class FragmentFinder:
 		
 		genomic_offset_masked_region - imagine your pre-miRNA is starts at position 400.000 in the genome; then your position should be 400.000 + start
 		
+		The positions in pstart and pstop are positions in the reference
+		sequence, the positions in pexpectedStart and pexpectedStop and
+		the fragments' start and stop attributes are relative to
+		genomic_offset_masked_region. pstart and pstop are not modified.
+		
 		----
 		@return:
 		@rtype:
 		"""
 		fragments = []
 		if(len(pstart) >= len(pstop)):									# More start than stop positions
+			order = dict((s,i) for i,s in enumerate(pstart))			# Ties depend on the iteration order of the peaks
+			positions = sorted(pstart.keys())							# Start positions that are not yet part of a fragment
+			
 			pstopSorted = sorted(pstop.iteritems(),key=operator.itemgetter(1))[::-1]
 			for itema in pstopSorted:
 				pos = itema[0]
-				diff = pexpectedStop[pos]
+				diff = pexpectedStop[pos-genomic_offset_masked_region]
 				predictedPos = pos+diff+1								# 149 - 50 = 99; 149- 50 + 1 = 100 (example of read aligned to 100,149 (size=50)
-				fragment = False
 				
-				highest = 0
-				items = [s for s in pstart if ((s >= predictedPos-15) and (s <= predictedPos+15))]
-				for item in items:
-					distance = abs(predictedPos - item)
-					penalty = 1.0 - (distance * 0.09)
-					score = pstart[item]*penalty 
-					if(score >= highest):
-						highest = pstart[item]
-						
-						fragment = ncRNAfragment(item,pos,None,self.masked_region,genomic_offset_masked_region)
-						fragment.supporting_reads_start = pstart[fragment.start]
-						fragment.supporting_reads_stop = pstop[fragment.stop]
-				
-				if(fragment != False):
+				item = self.find_partner_peak(predictedPos,pstart,positions,order)
+				if(item != None):
+					fragment = ncRNAfragment(item-genomic_offset_masked_region,pos-genomic_offset_masked_region,None,self.masked_region,genomic_offset_masked_region)
+					fragment.supporting_reads_start = pstart[item]
+					fragment.supporting_reads_stop = pstop[pos]
+					
 					fragments.append(fragment)
-					del(pstart[fragment.start])
-					items = []
+					del(positions[bisect.bisect_left(positions,item)])
 		else:															# More stop than start positions
+			order = dict((s,i) for i,s in enumerate(pstop))
+			positions = sorted(pstop.keys())
+			
 			pstartSorted = sorted(pstart.iteritems(),key=operator.itemgetter(1))[::-1]
 			for itema in pstartSorted:
 				pos = itema[0]
-				diff = pexpectedStart[pos]
+				diff = pexpectedStart[pos-genomic_offset_masked_region]
 				
 				#@todo figure out if this requires << + 1
 				predictedPos = pos+diff
-				fragment = False
-				
-				highest = 0
-				items = [s for s in pstop if ((s >= predictedPos-15) and (s <= predictedPos+15))]
 				
-				for item in items:
-					distance = abs(predictedPos - item)
-					penalty = 1.0 - (distance * 0.09)
-					score = pstop[item]*penalty 
-					if(score >= highest):
-						highest = pstop[item]
-						
-						#fragment = {'start':pos,'stop':item,'sequence':None}
-						#fragment['start_supporting_reads'] = pstart[fragment['start']]
-						#fragment['stop_supporting_reads']  = pstop[fragment['stop']]
-						
-						fragment = ncRNAfragment(pos,item,None,self.masked_region,genomic_offset_masked_region)
-						fragment.supporting_reads_start = pstart[fragment.start]
-						fragment.supporting_reads_stop = pstop[fragment.stop]
-				
-				if(fragment != False):
+				item = self.find_partner_peak(predictedPos,pstop,positions,order)
+				if(item != None):
+					fragment = ncRNAfragment(pos-genomic_offset_masked_region,item-genomic_offset_masked_region,None,self.masked_region,genomic_offset_masked_region)
+					fragment.supporting_reads_start = pstart[pos]
+					fragment.supporting_reads_stop = pstop[item]
+					
 					fragments.append(fragment)
-					del(pstop[fragment.stop])
-					items = []
+					del(positions[bisect.bisect_left(positions,item)])
 		#(counter >= fragment['start']) and (counter < fragment['stop'])
 		
 		for fragment in fragments:
@@ -268,11 +365,42 @@ class FragmentFinder:
 				'3_prime_cut':cut3,
 				
 				'5_prime_pos':fragment['start']-cut5,
-				'3_prime_pos':fragment.stop+cut3
+				'3_prime_pos':fragment['stop']+cut3
 				}
 		
 		return fragments
 	
+	def find_partner_peak(self,predictedPos,peaks,positions,order):
+		"""Finds the peak that pairs with a peak on the other side,
+		within 15 positions of its predicted position. The candidates
+		are found by bisecting the sorted positions.
+		
+		----
+		@param predictedPos: position predicted by the median read length
+		@param peaks: {position: height}
+		@param positions: sorted positions of the peaks that are still available
+		@param order: {position: index in the iteration order of peaks}
+		
+		@return: position of the partner peak or None; the candidates are
+		 visited in the iteration order of peaks and replace the partner
+		 if their score is at least the height of the partner
+		@rtype: int
+		"""
+		items = positions[bisect.bisect_left(positions,predictedPos-15):bisect.bisect_right(positions,predictedPos+15)]
+		items = sorted(items,key=order.__getitem__)
+		
+		partner = None
+		highest = 0
+		for item in items:
+			distance = abs(predictedPos - item)
+			penalty = 1.0 - (distance * 0.09)
+			score = peaks[item]*penalty 
+			if(score >= highest):
+				highest = peaks[item]
+				partner = item
+		
+		return partner
+	
 	def run(self):
 		"""
 		----
@@ -281,18 +409,29 @@ class FragmentFinder:
 		"""
 		
 		# Finds peaks
-		self.peaksStart = self.findPeaks(self.positions['startPositions']+[0])
-		self.peaksStop = self.findPeaks(self.positions['stopPositions']+[0])
+		self.peaksStart = self.get_peaks(self.positions['startPositions'])
+		self.peaksStop = self.get_peaks(self.positions['stopPositions'])
 		
 		# Correct / filter noisy peaks
 		self.correctedPeaksStart = self.correctNeighbourPeaks(self.peaksStart)
 		self.correctedPeaksStop = self.correctNeighbourPeaks(self.peaksStop)
 		
 		# Trace start and stop positions together and obtain actual peaks
-		self.results = self.find_fragments(self.correctedPeaksStart,self.correctedPeaksStop,self.positions['startAvgLengths'],self.positions['stopAvgLengths'])
+		self.results = self.find_fragments(self.correctedPeaksStart,self.correctedPeaksStop,self.positions['startAvgLengths'],self.positions['stopAvgLengths'],genomic_offset_masked_region=self.offset)
 		
 		return True
 	
+	def release_statistics(self):
+		"""Drops the position counts and the peaks, which are not needed
+		anymore once the fragments have been traced. Only the results
+		are kept.
+		"""
+		self.positions = None
+		self.peaksStart = None
+		self.peaksStop = None
+		self.correctedPeaksStart = None
+		self.correctedPeaksStop = None
+	
 	def getResults(self):
 		"""
 		---
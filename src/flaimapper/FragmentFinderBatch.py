@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+
+"""FlaiMapper: computational annotation of small ncRNA derived fragments using RNA-seq high throughput data
+
+ Here we present Fragment Location Annotation Identification mapper
+ (FlaiMapper), a method that extracts and annotates the locations of
+ sncRNA-derived RNAs (sncdRNAs). These sncdRNAs are often detected in
+ sequencing data and observed as fragments of their  precursor sncRNA.
+ Using small RNA-seq read alignments, FlaiMapper is able to annotate
+ fragments primarily by peak-detection on the start and  end position
+ densities followed by filtering and a reconstruction processes.
+ Copyright (C) 2011-2014:
+ - Youri Hoogstrate
+ - Elena S. Martens-Uzunova
+ - Guido Jenster
+ 
+ 
+ [License: GPL3]
+ 
+ This file is part of flaimapper.
+ 
+ flaimapper is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ flaimapper is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import os,re,random,operator,argparse,sys
+import numpy
+
+from flaimapper.FragmentFinder import FragmentFinder
+
+
+class FragmentFinderBatch:
+	"""Runs the fragment detection of FragmentFinder for many masked
+	regions at once.
+	
+	Most masked regions (tRNAs, snoRNAs, pre-miRNAs) are short and the
+	fixed costs per region outweigh the actual work. Therefore the
+	start and stop position counts of all regions are concatenated into
+	a single array, separated by a gap of empty positions that is wider
+	than the range of the neighbour peak filter. The peak detection and
+	neighbour peak filtering then take place on the entire batch. Only
+	the tracing of the fragments remains per region, because its ties
+	depend on the order of the peaks within the region.
+	
+	The results are identical to those of FragmentFinder.
+	"""
+	def run(self,batch):
+		"""
+		----
+		@param batch: list of (masked region, MaskedRegion) tuples of
+		 which the statistics have been parsed
+		
+		@return: a FragmentFinder with the results for each masked region
+		@rtype: list
+		"""
+		finders = []
+		for masked_region,readcount in batch:
+			finder = FragmentFinder(masked_region,readcount,False)
+			finder.set_positions(readcount)
+			finders.append(finder)
+		
+		if(len(finders) > 0):
+			origins = [finder.offset for finder in finders]
+			
+			peaks_start = self.find_peaks(finders[0],[finder.positions['startPositions'] for finder in finders],origins)
+			peaks_stop = self.find_peaks(finders[0],[finder.positions['stopPositions'] for finder in finders],origins)
+			
+			for i in range(len(finders)):
+				finder = finders[i]
+				finder.peaksStart,finder.correctedPeaksStart = peaks_start[i]
+				finder.peaksStop,finder.correctedPeaksStop = peaks_stop[i]
+				
+				finder.results = finder.find_fragments(finder.correctedPeaksStart,finder.correctedPeaksStop,finder.positions['startAvgLengths'],finder.positions['stopAvgLengths'],genomic_offset_masked_region=finder.offset)
+		
+		return finders
+	
+	def find_peaks(self,finder,histograms,origins):
+		"""Finds and filters the peaks of the position counts of all
+		masked regions at once.
+		
+		----
+		@param finder: FragmentFinder used for the peak detection
+		@param histograms: [start/stop]-position counts per masked region
+		@param origins: position in the reference sequence of the first
+		 position of each histogram
+		
+		@return: (peaks, corrected peaks) per masked region, both as
+		 {position: height} like FragmentFinder.get_peaks() and
+		 FragmentFinder.correctNeighbourPeaks()
+		@rtype: list
+		"""
+		gap = numpy.zeros(FragmentFinder.pmatrix_size + 1,dtype=numpy.int64)	# Also allows a peak at the last position
+		
+		values = []
+		offsets = []
+		offset = 0
+		for histogram in histograms:
+			values.append(histogram)
+			values.append(gap)
+			offsets.append(offset)
+			offset += len(histogram) + len(gap)
+		
+		positions,heights = finder.find_peaks(numpy.concatenate(values))
+		kept = self.correct_neighbour_peaks(positions,heights)
+		
+		regions = numpy.searchsorted(offsets,positions,side='right') - 1
+		bounds = numpy.searchsorted(regions,numpy.arange(len(histograms) + 1)).tolist()
+		
+		positions = (positions - numpy.array(offsets,dtype=numpy.int64)[regions] + numpy.array(origins,dtype=numpy.int64)[regions]).tolist()
+		heights = heights.tolist()
+		kept = kept.tolist()
+		
+		peaks = []
+		for i in range(len(histograms)):
+			plist = dict(zip(positions[bounds[i]:bounds[i+1]],heights[bounds[i]:bounds[i+1]]))
+			plist_kept = set([positions[j] for j in range(bounds[i],bounds[i+1]) if kept[j]])
+			
+			peaks.append((plist,finder.select_peaks(plist,plist_kept)))
+		
+		return peaks
+	
+	def correct_neighbour_peaks(self,positions,heights):
+		"""Vectorized version of FragmentFinder.correctNeighbourPeaks().
+		
+		A peak can only be removed by a higher peak in its neighbourhood,
+		which on its turn must not have been removed. Instead of visiting
+		the peaks from high to low, all peaks that can not be removed
+		anymore are kept and all peaks that are removed by a kept peak
+		are discarded, until every peak has been decided upon.
+		
+		----
+		@param positions: sorted positions of the peaks
+		@param heights: heights of the peaks
+		
+		@return: whether each peak is kept
+		@rtype: numpy array of booleans
+		"""
+		size = FragmentFinder.pmatrix_size
+		pmatrix = numpy.array(FragmentFinder.pmatrix_vector)
+		
+		# Peaks within the range of pmatrix that remove each other
+		sources = [numpy.zeros(0,dtype=numpy.int64)]
+		targets = [numpy.zeros(0,dtype=numpy.int64)]
+		for k in range(1,size + 1):
+			a = numpy.arange(max(0,len(positions) - k))
+			b = a + k
+			diff = positions[b] - positions[a]
+			
+			neighbours = diff <= size
+			if(not neighbours.any()):
+				break
+			
+			a = a[neighbours]
+			b = b[neighbours]
+			diff = diff[neighbours]
+			
+			removes = (pmatrix[size + diff] * heights[a]) > heights[b]
+			sources.append(a[removes])
+			targets.append(b[removes])
+			
+			removes = (pmatrix[size - diff] * heights[b]) > heights[a]
+			sources.append(b[removes])
+			targets.append(a[removes])
+		
+		sources = numpy.concatenate(sources)
+		targets = numpy.concatenate(targets)
+		
+		state = numpy.zeros(len(positions),dtype=numpy.int8)			# 0: undecided, 1: kept, -1: removed
+		while((state == 0).any()):
+			state[targets[(state[sources] == 1) & (state[targets] == 0)]] = -1
+			
+			undecided = numpy.bincount(targets[state[sources] == 0],minlength=len(positions))
+			state[(state == 0) & (undecided == 0)] = 1
+		
+		return state == 1
@@ -39,6 +39,7 @@
 
 
 import os,re,random,operator,argparse,sys
+import numpy
 
 
 from flaimapper.Read import Read
@@ -48,7 +49,18 @@ from flaimapper.ncRNAfragment import ncRNAfragment
 class MaskedRegion:
 	"""A masked region is a region masked in the reference genome to 
 	indicate where ncRNAs are located.
+	
+	The reads of a masked region are counted per (start, stop) pair,
+	see get_read_pairs(). All statistics are derived from these counts.
+	
+	If a maximal depth is set (see set_max_depth()), masked regions
+	with more reads are downsampled and their counts are scaled up.
 	"""
+	buffer_size = 65536
+	buffers = []														# Read coordinate buffers, reused among masked regions
+	max_buffers = 4														# Maximal number of buffers kept for reuse
+	max_depth = 0
+	
 	def __init__(self,name,start,stop,alignments,verbosity):
 		self.verbosity = verbosity
 		
@@ -58,77 +70,470 @@ class MaskedRegion:
 		self.stop = stop
 		
 		self.alignments = alignments
+		
+		self.read_pairs = None
+		
+		self.downsampling = None
+	
+	def set_max_depth(self,max_depth):
+		"""Masked regions with more than max_depth reads are downsampled:
+		only a sample of (on average) at most max_depth reads is counted
+		and each sampled read counts for 2 ** level reads, where level is
+		the lowest sampling level that sufficed, see sample_reads().
+		
+		----
+		@param max_depth: maximal number of reads, 0 to disable
+		"""
+		self.max_depth = max_depth
 	
 	def reset(self):
+		"""Prepares the counting of reads per (start, stop) pair, which
+		are relative to the start of the masked region.
+		"""
 		self.sequence = False
 		
-		self.start_positions = []
-		self.stop_positions = []
+		self.read_pairs = None
+		self.pending_pairs = []											# Pair counts of batches of reads that have not been merged yet
+		self.pending_size = 0
+		
+		self.downsampling = None
+		self.reads_sampled = 0
+		self.sampling_level = 0
+		self.sampling_keys = numpy.zeros(0,dtype=numpy.uint64)			# Number of reads per key seen so far, see hash_reads()
+		self.sampling_counts = numpy.zeros(0,dtype=numpy.int64)
+		self.sampled_reads = []											# Batches of (start, stop, weight, hash) of the sampled reads
+		self.sampled_size = 0
+		
+		self.buffer = None												# Only allocated by add_read()
+		self.buffered = 0
 	
-	def parse_stats(self):
-		self.reset()
+	def get_buffer(self):
+		if(len(MaskedRegion.buffers) > 0):
+			return MaskedRegion.buffers.pop()
+		else:
+			return numpy.empty((3,self.buffer_size),dtype=numpy.int64)
+	
+	def release_buffer(self):
+		"""Returns the buffer to the pool, unless the pool already holds
+		max_buffers buffers. Buffered reads that have not been flushed
+		are discarded.
+		"""
+		if(self.buffer is not None):
+			if(len(MaskedRegion.buffers) < self.max_buffers):
+				MaskedRegion.buffers.append(self.buffer)
+			
+			self.buffer = None
+			self.buffered = 0
+	
+	def add_read(self,read):
+		"""Adds a single read to the pair counts; reset() has to be
+		called first and finish_reads() or summarize_stats() after the
+		last read.
 		
-		start_avg_lengths = []
-		stop_avg_lengths = []
+		The coordinates are collected in a buffer which is added to the
+		pair counts in bulk, see add_reads(). The buffer is taken from
+		the pool by the first read and returned by finish_reads().
+		"""
+		if(self.buffer is None):
+			self.buffer = self.get_buffer()
 		
-		for read in self.parse_reads():
-			while(len(self.start_positions) < read.stop+1):				# Fix since 1.1.0: automatically scale  vector up if alignment falls outside range reference annotation
-				self.start_positions.append(0)
-				self.stop_positions.append(0)
+		self.buffer[0,self.buffered] = read.start
+		self.buffer[1,self.buffered] = read.stop
+		self.buffer[2,self.buffered] = read.weight
+		self.buffered += 1
+		
+		if(self.buffered == self.buffer.shape[1]):
+			self.flush_reads()
+	
+	def flush_reads(self):
+		if(self.buffered > 0):
+			self.add_reads(self.buffer[0,:self.buffered],self.buffer[1,:self.buffered],self.buffer[2,:self.buffered])
+			self.buffered = 0
+	
+	def add_reads(self,starts,stops,weights=None):
+		"""Adds a batch of reads to the pair counts.
+		
+		----
+		@param starts: numpy array with the start positions of the reads
+		@param stops: numpy array with the stop positions of the reads
+		@param weights: numpy array with the number of copies of each
+		 read, or None if each read represents one copy
+		"""
+		if(len(starts) > 0):
+			if(self.max_depth > 0):
+				self.sample_reads(starts - self.start,stops - self.start,weights)
+			else:
+				self.pending_pairs.append(self.count_pairs(starts - self.start,stops - self.start,weights))
+				self.pending_size += len(self.pending_pairs[-1][0])
 				
-				start_avg_lengths.append([])
-				stop_avg_lengths.append([])
+				if(self.pending_size > 16 * self.buffer_size):
+					self.merge_pairs()
+	
+	def sample_reads(self,starts,stops,weights):
+		"""Keeps a sample of at most max_depth reads.
+		
+		Each read is assigned a hash, see hash_reads(). At sampling
+		level k only the reads of which the hash is below 2 ** (64 - k)
+		are kept, i.e. one in 2 ** k reads. As soon as more than
+		max_depth reads are kept the level is raised, which removes
+		about half of the kept reads. The sample therefore does not
+		depend on the size of the batches or the order of the reads,
+		and is the same whether the reads are fetched or swept.
+		"""
+		if(weights is None):
+			weights = numpy.ones(len(starts),dtype=numpy.int64)
+		
+		hashes = self.hash_reads(starts,stops,weights)
+		self.reads_sampled += len(starts)
+		
+		selected = self.select_hashes(hashes)
+		self.sampled_reads.append((starts[selected],stops[selected],weights[selected],hashes[selected]))
+		self.sampled_size += len(self.sampled_reads[-1][0])
+		
+		if(self.sampled_size > self.max_depth):
+			sampled_reads = [numpy.concatenate([batch[i] for batch in self.sampled_reads]) for i in range(4)]
+			
+			while(len(sampled_reads[3]) > self.max_depth):
+				self.sampling_level += 1
+				selected = self.select_hashes(sampled_reads[3])
+				sampled_reads = [column[selected] for column in sampled_reads]
+			
+			self.sampled_reads = [tuple(sampled_reads)]
+			self.sampled_size = len(sampled_reads[3])
+	
+	def select_hashes(self,hashes):
+		if(self.sampling_level == 0):
+			return numpy.ones(len(hashes),dtype=bool)
+		else:
+			return (hashes >> numpy.uint64(64 - self.sampling_level)) == 0
+	
+	def hash_reads(self,starts,stops,weights):
+		"""Hashes each read by its start, stop and weight, and the number
+		of identical reads that preceded it. Identical reads can not be
+		told apart, so the hashes do not depend on the order of the
+		reads.
+		
+		----
+		@return: 64-bit hash of each read
+		@rtype: numpy array
+		"""
+		keys = self.mix(self.mix(self.mix(starts.astype(numpy.uint64)) ^ stops.astype(numpy.uint64)) ^ weights.astype(numpy.uint64))
+		
+		# Occurrence of each read among the identical reads in the batch
+		order = numpy.argsort(keys,kind='mergesort')
+		sorted_keys = keys[order]
+		first = numpy.ones(len(keys),dtype=bool)
+		first[1:] = sorted_keys[1:] != sorted_keys[:-1]
+		group_starts = numpy.flatnonzero(first)
+		groups = numpy.cumsum(first) - 1
+		
+		# ... increased by the number of identical reads in earlier batches
+		unique_keys = sorted_keys[group_starts]
+		index = numpy.minimum(numpy.searchsorted(self.sampling_keys,unique_keys),max(0,len(self.sampling_keys) - 1))
+		seen = numpy.zeros(len(unique_keys),dtype=numpy.int64)
+		if(len(self.sampling_keys) > 0):
+			found = self.sampling_keys[index] == unique_keys
+			seen[found] = self.sampling_counts[index[found]]
+		
+		occurrences = numpy.empty(len(keys),dtype=numpy.int64)
+		occurrences[order] = numpy.arange(len(keys)) - group_starts[groups] + seen[groups]
+		
+		self.sampling_keys,index = numpy.unique(numpy.concatenate([self.sampling_keys,unique_keys]),return_inverse=True)
+		self.sampling_counts = self.bincount(index,numpy.concatenate([self.sampling_counts,numpy.diff(numpy.append(group_starts,len(keys)))]),len(self.sampling_keys))
+		
+		return self.mix(keys ^ occurrences.astype(numpy.uint64))
+	
+	def mix(self,x):
+		"""64-bit mix function (splitmix64)"""
+		x = x + numpy.uint64(0x9E3779B97F4A7C15)
+		x = (x ^ (x >> numpy.uint64(30))) * numpy.uint64(0xBF58476D1CE4E5B9)
+		x = (x ^ (x >> numpy.uint64(27))) * numpy.uint64(0x94D049BB133111EB)
+		return x ^ (x >> numpy.uint64(31))
+	
+	def finish_sampling(self):
+		"""Counts the sampled reads, each representing 2 ** level reads.
+		
+		----
+		@return: None if the masked region was not downsampled, otherwise
+		 a tuple of the number of alignments, the number of sampled
+		 alignments and the scale of the counts
+		"""
+		if(len(self.sampled_reads) > 0):
+			starts,stops,weights,hashes = [numpy.concatenate([batch[i] for batch in self.sampled_reads]) for i in range(4)]
 			
-			self.start_positions[read.start] += 1
-			self.stop_positions[read.stop] += 1
+			scale = 2 ** self.sampling_level
+			self.pending_pairs = [self.count_pairs(starts,stops,weights * scale)]
+			self.pending_size = len(self.pending_pairs[0][0])
+		
+		del(self.sampled_reads,self.sampled_size,self.sampling_keys,self.sampling_counts)
+		
+		if(self.sampling_level > 0):
+			if(self.verbosity == "verbose"):
+				print "     * Downsampled "+str(self.reads_sampled)+" alignments to "+str(len(starts))+" (scale: "+str(scale)+")"
+			
+			return (self.reads_sampled,len(starts),scale)
+		else:
+			return None
+	
+	def merge_pairs(self):
+		if(len(self.pending_pairs) > 1):
+			starts = numpy.concatenate([pairs[0] for pairs in self.pending_pairs])
+			stops = numpy.concatenate([pairs[1] for pairs in self.pending_pairs])
+			counts = numpy.concatenate([pairs[2] for pairs in self.pending_pairs])
+			
+			self.pending_pairs = [self.count_pairs(starts,stops,counts)]
+			self.pending_size = len(starts)
+	
+	def count_pairs(self,starts,stops,weights=None):
+		"""Counts the reads per unique (start, stop) pair.
+		
+		----
+		@return: the starts and stops of the pairs, sorted by start and
+		 stop, and the number of reads of each pair
+		@rtype: tuple of three numpy arrays
+		"""
+		if(len(starts) == 0):
+			return (numpy.zeros(0,dtype=numpy.int64),numpy.zeros(0,dtype=numpy.int64),numpy.zeros(0,dtype=numpy.int64))
+		
+		# Pairs are encoded as (start, length) in a single integer
+		first = starts.min()
+		lengths = stops - starts
+		shortest = lengths.min()
+		width = lengths.max() - shortest + 1
+		
+		keys,index = numpy.unique((starts - first) * width + (lengths - shortest),return_inverse=True)
+		
+		starts = (keys // width) + first
+		stops = starts + (keys % width) + shortest
+		
+		return (starts,stops,self.bincount(index,weights,len(keys)))
+	
+	def finish_reads(self):
+		"""Adds the remaining buffered reads and caches the pair counts,
+		see get_read_pairs().
+		"""
+		try:
+			self.flush_reads()
+		finally:
+			self.release_buffer()
+		
+		self.downsampling = self.finish_sampling()
+		
+		self.merge_pairs()
+		if(len(self.pending_pairs) > 0):
+			self.read_pairs = self.pending_pairs[0]
+		else:
+			self.read_pairs = self.count_pairs([],[])
+		
+		del(self.pending_pairs,self.pending_size)
+	
+	def parse_read_pairs(self):
+		self.reset()
+		
+		try:
+			for starts,stops,weights in self.parse_read_batches():
+				self.add_reads(starts,stops,weights)
 			
-			start_avg_lengths[read.start].append(read.stop-read.start)
-			stop_avg_lengths[read.stop].append(read.start-read.stop)
-		
-		self.start_avg_lengths = []
-		self.stop_avg_lengths = []
-		
-		for i in range(len(stop_avg_lengths)):
-			avgLenF = self.get_median(start_avg_lengths[i])
-			avgLenR = self.get_median(stop_avg_lengths[i])
-			if(avgLenF):
-				avgLenF = round(avgLenF+1)
-			if(avgLenR):
-				avgLenR = round(avgLenR-0.5)							# Why -0.5 -> because of rounding a negative number
-			self.start_avg_lengths.append(avgLenF)
-			self.stop_avg_lengths.append(avgLenR)
+			self.finish_reads()
+		finally:
+			self.release_buffer()
+	
+	def get_read_pairs(self):
+		"""Returns the number of reads per (start, stop) pair. All other
+		statistics are derived from these counts, which are parsed from
+		the alignments only once.
+		
+		----
+		@return: the starts and stops of the pairs, relative to the start
+		 of the masked region and sorted by start and stop, and the
+		 number of reads of each pair
+		@rtype: tuple of three numpy arrays
+		"""
+		if(self.read_pairs is None):
+			self.parse_read_pairs()
+		
+		return self.read_pairs
+	
+	def has_reads(self):
+		"""Tells whether the masked region contains any read, using the
+		pair counts if they have been parsed already and otherwise
+		reading no further than the first read.
+		"""
+		if(self.read_pairs is not None):
+			return len(self.read_pairs[0]) > 0
+		else:
+			return next(self.parse_reads(),None) is not None
+	
+	def bincount(self,indices,weights,length):
+		"""numpy.bincount() for integer weights"""
+		if(weights is None):
+			return numpy.bincount(indices,minlength=length)
+		else:
+			return numpy.rint(numpy.bincount(indices,weights=weights,minlength=length)).astype(numpy.int64)
+	
+	def summarize_stats(self):
+		"""Derives the start and stop position counts and the median read
+		lengths per position from the pair counts.
+		
+		The statistics start at the start of the masked region, or at the
+		start of the first read if that read starts before the masked
+		region; origin is their first position in the reference
+		sequence. Reads that end after the masked region scale the
+		statistics up.
+		"""
+		if(self.read_pairs is None):
+			self.finish_reads()
+		
+		starts,stops,counts = self.read_pairs
+		
+		shift = 0
+		if(len(starts) > 0):
+			shift = min(0,starts.min())
+		
+		self.origin = self.start + shift
+		starts = starts - shift
+		stops = stops - shift
+		
+		length = max(0,self.stop - self.start + 1 - shift)
+		if(len(stops) > 0):
+			length = max(length,stops.max()+1)						# Fix since 1.1.0: automatically scale  vector up if alignment falls outside range reference annotation
+		
+		self.start_positions = self.bincount(starts,counts,length)
+		self.stop_positions = self.bincount(stops,counts,length)
+		
+		avgLenF = self.get_medians(starts,stops - starts,counts,self.start_positions)
+		avgLenR = -self.get_medians(stops,stops - starts,counts,self.stop_positions)
+		
+		# Median lengths of 0 are kept as they are, the others are rounded
+		# half away from zero, like python's round()
+		# Why -0.5 -> because of rounding a negative number
+		self.start_avg_lengths = numpy.where(avgLenF != 0,self.round(avgLenF+1),avgLenF)
+		self.stop_avg_lengths = numpy.where(avgLenR != 0,self.round(avgLenR-0.5),avgLenR)
 		
 		return [self.start_positions,self.stop_positions,self.start_avg_lengths,self.stop_avg_lengths]
 	
-	def parse_reads_stacked(self,return_sorted = True):
-		if(return_sorted):
-			index = {}
-			for read in self.parse_reads():
-				if(not read.start in index.keys()):
-					index[read.start] = {}
-				
-				if(read.stop in index[read.start].keys()):
-					index[read.start][read.stop] += 1
-				else:
-					index[read.start][read.stop] = 1
+	def get_medians(self,positions,lengths,counts,totals):
+		"""Finds the median read length at each position.
+		
+		----
+		@param positions: start or stop position of each (start, stop) pair
+		@param lengths: read length of each pair
+		@param counts: number of reads of each pair
+		@param totals: number of reads per position
+		
+		@return: median per position; NaN for positions without reads
+		@rtype: numpy array
+		"""
+		order = numpy.lexsort((lengths,positions))
+		positions = positions[order]
+		lengths = lengths[order]
+		cumulative = numpy.cumsum(counts[order])
+		
+		medians = numpy.full(len(totals),numpy.nan)
+		
+		# The k-th smallest length at a position is the first one of
+		# which the cumulative count exceeds k plus the reads at all
+		# preceding positions
+		covered = numpy.flatnonzero(totals > 0)
+		preceding = numpy.concatenate(([0],cumulative))[numpy.searchsorted(positions,covered)]
+		
+		lower = lengths[numpy.searchsorted(cumulative,preceding + (totals[covered] - 1) // 2,side='right')]
+		upper = lengths[numpy.searchsorted(cumulative,preceding + totals[covered] // 2,side='right')]
+		medians[covered] = (lower + upper) / 2.0
+		
+		return medians
+	
+	def round(self,values):
+		return numpy.copysign(numpy.floor(numpy.abs(values) + 0.5),values)
+	
+	def parse_stats(self):
+		self.get_read_pairs()
+		
+		return self.summarize_stats()
+	
+	def parse_read_batches(self,batch_size=buffer_size):
+		"""Returns the reads as (starts, stops, weights) tuples of numpy
+		arrays of at most batch_size reads. This avoids the overhead of
+		a Python object per read; subclasses may implement this without
+		parse_reads().
+		"""
+		starts = []
+		stops = []
+		weights = []
+		
+		for read in self.parse_reads():
+			starts.append(read.start)
+			stops.append(read.stop)
+			weights.append(read.weight)
 			
-			for start in sorted(index.keys()):
-				for stop in sorted(index[start].keys()):
-					yield [Read(start,stop,None),index[start][stop]]
+			if(len(starts) == batch_size):
+				yield self.to_batch(starts,stops,weights)
+				starts,stops,weights = [],[],[]
+		
+		if(len(starts) > 0):
+			yield self.to_batch(starts,stops,weights)
+	
+	def to_batch(self,starts,stops,weights=None):
+		starts = numpy.array(starts,dtype=numpy.int64)
+		stops = numpy.array(stops,dtype=numpy.int64)
+		
+		if(weights is None):
+			weights = numpy.ones(len(starts),dtype=numpy.int64)
 		else:
-			index = {}
-			for read in self.parse_reads():
-				if(not read.start in index.keys()):
-					index[read.start] = {}
+			weights = numpy.array(weights,dtype=numpy.int64)
+		
+		return (starts,stops,weights)
+	
+	def parse_reads_stacked(self,return_sorted = True):
+		"""Returns each unique (start, stop) pair once, together with its
+		number of reads; always sorted by start and stop.
+		
+		If the pairs have not been parsed yet and the reads can be
+		obtained sorted by their start position (see
+		parse_sorted_reads()), they are stacked while streaming and only
+		the reads at the current start position are kept in memory.
+		Otherwise the pairs are counted first, see get_read_pairs().
+		
+		----
+		@return: iterator of [Read, number of reads] lists
+		"""
+		if(self.read_pairs is None):
+			sorted_reads = self.parse_sorted_reads()
+			if(sorted_reads is not None):
+				return self.stack_sorted_reads(sorted_reads)
+		
+		return self.stack_read_pairs()
+	
+	def parse_sorted_reads(self):
+		"""
+		----
+		@return: iterator of (start, stop, weight) tuples sorted by start
+		 position, or None if the reads are not sorted
+		"""
+		return None
+	
+	def stack_sorted_reads(self,sorted_reads):
+		current = None
+		stops = {}
+		
+		for start,stop,weight in sorted_reads:
+			if(start != current):
+				for read_stop in sorted(stops.keys()):
+					yield [Read(current,read_stop,None),stops[read_stop]]
 				
-				if(read.stop in index[read.start].keys()):
-					index[read.start][read.stop] += 1
-				else:
-					index[read.start][read.stop] = 1
+				current = start
+				stops = {}
 			
-			for start in index.keys():
-				for stop in index[start].keys():
-					yield [Read(start,stop,None),index[start][stop]]
+			stops[stop] = stops.get(stop,0) + weight
+		
+		for read_stop in sorted(stops.keys()):
+			yield [Read(current,read_stop,None),stops[read_stop]]
+	
+	def stack_read_pairs(self):
+		starts,stops,counts = self.get_read_pairs()
+		
+		for start,stop,count in zip((starts + self.start).tolist(),(stops + self.start).tolist(),counts.tolist()):
+			yield [Read(start,stop,None),count]
 	
 	def get_median(self,numericValues):
 		"""Finds the median of a vector"""								# @TODO move to utils and rename to 'median()'
@@ -145,10 +550,48 @@ class MaskedRegion:
 			return (float(lower + upper)) / 2
 	
 	def count_reads_per_region(self,fragments):							# @TODO change to 'sequencing_depth()'
+		"""Counts the reads that are located entirely within each
+		fragment, using the (start, stop) pair counts.
+		
+		A read of length L starting at s lies within [start, stop] if
+		start <= s <= stop - L. The pairs are therefore sorted by
+		length and start, such that the reads of each length and each
+		fragment can be counted with two lookups in the cumulative
+		number of reads.
+		
+		----
+		@param fragments: list of ncRNAfragments
+		"""
+		starts,stops,counts = self.get_read_pairs()
+		
 		for fragment in fragments:
 			fragment.supporting_reads = 0
 		
-		for read in self.parse_reads():
-			for fragment in fragments:
-				if(fragment.spans_read(read)):
-					fragment.add_supporting_reads(1)
+		if(len(starts) > 0 and len(fragments) > 0):
+			fragment_starts = numpy.array([fragment['start'] - self.start for fragment in fragments],dtype=numpy.int64)
+			fragment_stops = numpy.array([fragment['stop'] - self.start for fragment in fragments],dtype=numpy.int64)
+			
+			# Reads and fragments may start before the masked region
+			shift = min(0,starts.min(),fragment_starts.min())
+			starts = starts - shift
+			stops = stops - shift
+			fragment_starts = fragment_starts - shift
+			fragment_stops = fragment_stops - shift
+			
+			lengths = stops - starts
+			size = max(stops.max(),fragment_starts.max(),fragment_stops.max()) + 2
+			
+			keys = (lengths * size) + starts
+			order = numpy.argsort(keys,kind='mergesort')
+			keys = keys[order]
+			cumulative = numpy.concatenate(([0],numpy.cumsum(counts[order])))
+			
+			read_lengths = numpy.unique(lengths)[:,numpy.newaxis]
+			first = (read_lengths * size) + fragment_starts
+			last = (read_lengths * size) + numpy.maximum(fragment_stops - read_lengths,-1)
+			
+			spanned = cumulative[numpy.searchsorted(keys,last,side='right')] - cumulative[numpy.searchsorted(keys,first,side='left')]
+			spanned = numpy.where(last >= first,spanned,0).sum(axis=0)
+			
+			for i in range(len(fragments)):
+				fragments[i].add_supporting_reads(int(spanned[i]))
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+"""FlaiMapper: computational annotation of small ncRNA derived fragments using RNA-seq high throughput data
+
+ Here we present Fragment Location Annotation Identification mapper
+ (FlaiMapper), a method that extracts and annotates the locations of
+ sncRNA-derived RNAs (sncdRNAs). These sncdRNAs are often detected in
+ sequencing data and observed as fragments of their  precursor sncRNA.
+ Using small RNA-seq read alignments, FlaiMapper is able to annotate
+ fragments primarily by peak-detection on the start and  end position
+ densities followed by filtering and a reconstruction processes.
+ Copyright (C) 2011-2014:
+ - Youri Hoogstrate
+ - Elena S. Martens-Uzunova
+ - Guido Jenster
+ 
+ 
+ [License: GPL3]
+ 
+ This file is part of flaimapper.
+ 
+ flaimapper is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ flaimapper is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+
+
+import os,re,random,operator,argparse,sys,gzip,threading,Queue
+import pysam
+
+
+class OutputWriter:
+	"""Buffered output file, used by all exporters.
+	
+	The many small writes of the exporters are collected and written in
+	chunks of buffer_size bytes. Output filenames ending with '.gz' are
+	compressed with gzip and filenames ending with '.bgz' with bgzip.
+	Optionally the chunks are compressed and written by a separate
+	thread, so that this overlaps with the fragment detection (zlib and
+	the file system release the GIL).
+	
+	When streaming, flush() is called after each masked region, such
+	that the output is not held back until a whole chunk is filled.
+	Compressed outputs are not flushed, because this would degrade the
+	compression and the blocks can not be read before they are complete.
+	"""
+	buffer_size = 1024 * 1024
+	queue_size = 4														# Maximal number of chunks waiting for the writer thread
+	flush_marker = object()												# Queued by flush() for the writer thread
+	
+	def __init__(self,filename,threaded=False):
+		"""
+		----
+		@param filename: output filename; '-' for stdout
+		@param threaded: write the chunks in a separate thread
+		"""
+		if(filename == "-"):
+			self.fh = sys.stdout
+		elif(filename.endswith(".bgz")):
+			self.fh = pysam.BGZFile(filename,'wb')
+		elif(filename.endswith(".gz")):
+			self.fh = gzip.open(filename,'wb')
+		else:
+			self.fh = open(filename,'wb')
+		
+		self.compressed = (filename != "-") and (filename.endswith(".bgz") or filename.endswith(".gz"))
+		
+		self.buffer = []
+		self.buffered = 0
+		
+		self.error = None
+		if(threaded):
+			self.queue = Queue.Queue(self.queue_size)
+			self.thread = threading.Thread(target=self.run)
+			self.thread.daemon = True
+			self.thread.start()
+		else:
+			self.queue = None
+	
+	def write(self,data):
+		self.buffer.append(data)
+		self.buffered += len(data)
+		
+		if(self.buffered >= self.buffer_size):
+			self.flush_buffer()
+	
+	def flush(self):
+		"""Writes the buffered data through to the file, unless it is
+		compressed.
+		"""
+		if(not self.compressed):
+			self.flush_buffer()
+			
+			if(self.queue is not None):
+				self.check_error()
+				self.queue.put(self.flush_marker)
+			else:
+				self.fh.flush()
+	
+	def flush_buffer(self):
+		if(self.buffered > 0):
+			chunk = "".join(self.buffer)
+			self.buffer = []
+			self.buffered = 0
+			
+			if(self.queue is not None):
+				self.check_error()
+				self.queue.put(chunk)
+			else:
+				self.fh.write(chunk)
+	
+	def run(self):
+		"""Writes the chunks of the queue until None is received. After
+		an error the remaining chunks are discarded, the error is raised
+		by the main thread, see check_error().
+		"""
+		while(True):
+			chunk = self.queue.get()
+			if(chunk is None):
+				break
+			elif(self.error is None):
+				try:
+					if(chunk is self.flush_marker):
+						self.fh.flush()
+					else:
+						self.fh.write(chunk)
+				except:
+					self.error = sys.exc_info()
+	
+	def check_error(self):
+		if(self.error is not None):
+			raise self.error[0],self.error[1],self.error[2]
+	
+	def close(self):
+		self.flush_buffer()
+		
+		if(self.queue is not None):
+			self.queue.put(None)
+			self.thread.join()
+			self.queue = None
+			self.check_error()
+		
+		if(self.fh == sys.stdout):
+			self.fh.flush()
+		else:
+			self.fh.close()
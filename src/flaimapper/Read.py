@@ -38,12 +38,20 @@
 
 # @TODO figure out how this can be integrated with or replaced by the "AlignedRead"-class from the pysam library
 
-class Read:
-	def __init__(self,start,stop,name=None,sequence=None):
+class Read(object):
+	"""Alignment coordinates of a single read. The name and sequence are
+	optional, because most of the analysis only requires the coordinates.
+	The weight is the number of identical reads it represents (collapsed
+	reads).
+	"""
+	__slots__ = ('start','stop','name','sequence','weight')
+	
+	def __init__(self,start,stop,name=None,sequence=None,weight=1):
 		self.start = start
 		self.stop = stop
 		self.name = name
 		self.sequence = sequence
+		self.weight = weight
 	
 	def size(self):
 		return (self.stop - self.start) - 1
@@ -50,9 +50,10 @@ class SSLMParser(MaskedRegion):
 	"""
 	regex1 = re.compile("^>(.*?)_x([0-9]+)$")
 	
-	def parse_reads(self):
-		"""parse the reads from a SSLM (FASTA) file and return each read
-		as an iterator object
+	def parse_alignments(self):
+		"""parse the alignments from a SSLM (FASTA) file and return each
+		unique read as a (start, stop, name, aligned sequence, number of
+		hits) tuple
 		"""
 		
 		previous_line = ""
@@ -76,25 +77,57 @@ class SSLMParser(MaskedRegion):
 								name = previous_line[1:k]
 								numberofhits = int(previous_line[k+5::])
 							else:
-								m = self.regex1.search(name)			# For the "_x123" suffix
+								m = self.regex1.search(previous_line)	# For the "_x123" suffix
 								
 								if(m):
 									name = m.group(1)
 									numberofhits = int(m.group(2))
 								else:
-									name = previous_line[::-1].lstrip(">")
+									name = previous_line.lstrip(">")
 									numberofhits = 1
 							
-							start_pos = self.get_start_position(line)
-							stop_pos = self.get_stop_position(line)
-							
-							for j in range(numberofhits):
-								yield Read(start_pos,stop_pos,name,line[start_pos:stop_pos])
+							yield (self.get_start_position(line),self.get_stop_position(line),name,line,numberofhits)
 					else:
 						previous_line = line
 					
 					i += 1
 	
+	def parse_reads(self,detailed=False):
+		"""parse the reads from a SSLM (FASTA) file and return each read
+		as an iterator object. Identical reads are returned once, with
+		their number of hits as weight.
+		
+		----
+		@param detailed: also extract the names and sequences of the
+		 reads, which is only required for converting alignments
+		"""
+		for start_pos,stop_pos,name,line,numberofhits in self.parse_alignments():
+			if(detailed):
+				yield Read(start_pos,stop_pos,name,line[start_pos:stop_pos],numberofhits)
+			else:
+				yield Read(start_pos,stop_pos,weight=numberofhits)
+	
+	def parse_read_batches(self,batch_size=MaskedRegion.buffer_size):
+		"""Returns the reads in batches of (starts, stops, weights)
+		numpy arrays. Identical reads are not repeated but weighted by
+		their number of hits.
+		"""
+		starts = []
+		stops = []
+		weights = []
+		
+		for start_pos,stop_pos,name,line,numberofhits in self.parse_alignments():
+			starts.append(start_pos)
+			stops.append(stop_pos)
+			weights.append(numberofhits)
+			
+			if(len(starts) == batch_size):
+				yield self.to_batch(starts,stops,weights)
+				starts,stops,weights = [],[],[]
+		
+		if(len(starts) > 0):
+			yield self.to_batch(starts,stops,weights)
+	
 	def get_alignment_files(self):
 		for alignment_directory in self.alignments:
 			with open(alignment_directory+"/idreadable.txt",'rU') as fh:
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""FlaiMapper: computational annotation of small ncRNA derived fragments using RNA-seq high throughput data
+
+ Here we present Fragment Location Annotation Identification mapper
+ (FlaiMapper), a method that extracts and annotates the locations of
+ sncRNA-derived RNAs (sncdRNAs). These sncdRNAs are often detected in
+ sequencing data and observed as fragments of their  precursor sncRNA.
+ Using small RNA-seq read alignments, FlaiMapper is able to annotate
+ fragments primarily by peak-detection on the start and  end position
+ densities followed by filtering and a reconstruction processes.
+ Copyright (C) 2011-2014:
+ - Youri Hoogstrate
+ - Elena S. Martens-Uzunova
+ - Guido Jenster
+ 
+ 
+ [License: GPL3]
+ 
+ This file is part of flaimapper.
+ 
+ flaimapper is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ flaimapper is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+
+
+import os,re,random,operator,argparse,sys,collections
+
+
+class SequenceCache:
+	"""Keeps recently used reference sequences in memory, so that the
+	sequences of the fragments can be sliced from them.
+	
+	Reference sequences that fit in the cache are kept entirely, such
+	that all masked regions located on them share a single fetch. Of
+	longer reference sequences, e.g. chromosomes, only the requested
+	span is kept; this should be the span of the masked region rather
+	than that of its fragments.
+	
+	The least recently used sequences are discarded as soon as their
+	total length exceeds max_size bytes.
+	"""
+	def __init__(self,fasta_file,max_size):
+		"""
+		----
+		@param fasta_file: pysam Fastafile
+		@param max_size: maximal size of the cached sequences in bytes
+		"""
+		self.fasta_file = fasta_file
+		self.max_size = max_size
+		self.clear()
+	
+	def clear(self):
+		self.size = 0
+		self.sequences = collections.OrderedDict()
+	
+	def fetch(self,name,start,stop):
+		"""
+		----
+		@param name: name of the reference sequence
+		@param start: 0-based start of the span
+		@param stop: 0-based end of the span, exclusive
+		
+		@return: the sequence of the span, like pysam's fetch()
+		@rtype: string
+		"""
+		if(self.fasta_file.get_reference_length(name) <= self.max_size):
+			return self.get(name,None,None)[start:stop]
+		else:
+			return self.get(name,start,stop)
+	
+	def get(self,name,start,stop):
+		key = (name,start,stop)
+		sequence = self.sequences.pop(key,None)
+		
+		if(sequence is None):
+			sequence = str(self.fasta_file.fetch(name,start,stop))
+			
+			if(len(sequence) > self.max_size):
+				return sequence
+			
+			self.size += len(sequence)
+			while(self.size > self.max_size and len(self.sequences) > 0):
+				oldest,old_sequence = self.sequences.popitem(last=False)
+				self.size -= len(old_sequence)
+		
+		self.sequences[key] = sequence									# Most recently used
+		
+		return sequence
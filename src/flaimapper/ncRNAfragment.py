@@ -78,7 +78,7 @@ class ncRNAfragment:
 		"""
 		no offset used..
 		"""
-		return (((read.start+offset_left) >= self.start) and ((read.stop-offset_right) <= self.stop))
+		return (((read.start+offset_left) >= self.get_start_position(True)) and ((read.stop-offset_right) <= self.get_stop_position(True)))
 	
 	def reset_supporting_reads(self):
 		self.supporting_reads = 0										# all reads in-between the fragment
@@ -92,21 +92,25 @@ class ncRNAfragment:
 	
 	def get_start_position(self,absolute=False):
 		if(absolute):
-			self.start + self.genomic_offset_masked_region
+			return self.start + self.genomic_offset_masked_region
 		else:
 			return self.start
 	
 	def get_stop_position(self,absolute=False):
 		if(absolute):
-			self.stop + self.genomic_offset_masked_region
+			return self.stop + self.genomic_offset_masked_region
 		else:
 			return self.stop
 	
 	def __getitem__(self,key):
+		"""The start and stop are reported as positions in the reference
+		sequence, while the start and stop attributes are relative to the
+		masked region.
+		"""
 		if(key == "start"):
-			return self.start
+			return self.get_start_position(True)
 		elif(key == "stop"):
-			return self.stop
+			return self.get_stop_position(True)
 		elif(key == 'start_supporting_reads'):
 			return self.supporting_reads_start
 		elif(key == 'stop_supporting_reads'):
@@ -47,6 +47,26 @@ def fasta_entry_names(fasta_file):
 				names[line[1:]] = True
 	return names.keys()
 
+def pair_outputs(formats,outputs):
+	"""Pairs the (repeatable) --format and --output arguments.
+	
+	----
+	@param formats: list of export formats, or None for the default
+	@param outputs: list of output filenames, or None for stdout
+	
+	@return: list of (export format, output filename) tuples
+	@rtype: list
+	"""
+	if(formats is None):
+		formats = [1]
+	if(outputs is None):
+		outputs = ["-"]
+	
+	if(len(formats) != len(outputs)):
+		raise ValueError("Each --format requires its own --output ("+str(len(formats))+" formats and "+str(len(outputs))+" outputs given)")
+	
+	return zip(formats,outputs)
+
 def parse_gff_annotation_name(string,gid="gene_id"):
 	matches = re.findall(re.escape(gid)+'=[\'" ]?([^\'";]+)',string)
 	return matches[0] if len(matches) > 0 else None
@@ -75,6 +95,10 @@ def parse_gff(gff_file):
 				if(len(region) >= 9):
 					name = parse_gff_annotation_name(region[8])
 				
+				strand = '.'
+				if(len(region) >= 7 and region[6] in ['+','-']):
+					strand = region[6]
+				
 				# GTF uses 1-based coordinates - convert them to 0-based
 				regions.append((
 					region[0],			# chr
@@ -82,7 +106,8 @@ def parse_gff(gff_file):
 					int(region[4])-1,	# end   (0-based)
 					0,					# score
 					name,				# name of precursor
-					len(regions)		# id in regions (0, 1, ...)
+					len(regions),		# id in regions (0, 1, ...)
+					strand				# strand ('+', '-' or '.')
 				))
 	
 	return regions
@@ -49,7 +49,8 @@ setup(name='flaimapper',
 		url='https://github.com/yhoogstrate/flaimapper',
 		scripts=["bin/flaimapper","bin/flaimapper-sslm","bin/sslm2bed","bin/sslm2sam","bin/gtf-from-fasta"],
 		packages=['flaimapper'],
-		install_requires=['pysam >= 0.8.0'],
+		test_suite='tests',
+		install_requires=['pysam >= 0.8.4','numpy'],
 		classifiers=[
 			'Environment :: Console',
 			'Intended Audience :: Science/Research',
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+"""FlaiMapper: computational annotation of small ncRNA derived fragments using RNA-seq high throughput data
+
+ Here we present Fragment Location Annotation Identification mapper
+ (FlaiMapper), a method that extracts and annotates the locations of
+ sncRNA-derived RNAs (sncdRNAs). These sncdRNAs are often detected in
+ sequencing data and observed as fragments of their  precursor sncRNA.
+ Using small RNA-seq read alignments, FlaiMapper is able to annotate
+ fragments primarily by peak-detection on the start and  end position
+ densities followed by filtering and a reconstruction processes.
+ Copyright (C) 2011-2014:
+ - Youri Hoogstrate
+ - Elena S. Martens-Uzunova
+ - Guido Jenster
+ 
+ 
+ [License: GPL3]
+ 
+ This file is part of flaimapper.
+ 
+ flaimapper is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ flaimapper is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+
+import os,random
+import pysam
+
+
+def write_alignments(directory,references,reads,regions,seed=0):
+	"""Writes a small data set: a random reference genome (FASTA), the
+	alignments of the reads (BAM) and the masked regions (GTF). The
+	FASTA and BAM files are indexed.
+	
+	----
+	@param directory: output directory
+	@param references: list of (name, length) tuples
+	@param reads: list of (reference name, start, stop) tuples; 0-based
+	 coordinates, both inclusive
+	@param regions: list of (reference name, start, stop, strand) tuples;
+	 0-based coordinates, both inclusive
+	@param seed: seed of the random reference sequences
+	
+	@return: the filenames of the BAM, FASTA and GTF file
+	@rtype: tuple
+	"""
+	rng = random.Random(seed)
+	
+	bam_file = os.path.join(directory,"alignments.bam")
+	fasta_file = os.path.join(directory,"reference.fa")
+	gtf_file = os.path.join(directory,"regions.gtf")
+	
+	sequences = {}
+	with open(fasta_file,"w") as fh:
+		for name,length in references:
+			sequences[name] = "".join([rng.choice("ACGT") for i in range(length)])
+			fh.write(">"+name+"\n"+sequences[name]+"\n")
+	pysam.faidx(fasta_file)
+	
+	with open(gtf_file,"w") as fh:
+		for i in range(len(regions)):
+			name,start,stop,strand = regions[i]
+			fh.write(name+"\tsynthetic\tgene\t"+str(start + 1)+"\t"+str(stop + 1)+"\t.\t"+strand+"\t.\tgene_id=precursor_"+str(i)+";\n")
+	
+	reference_ids = dict((references[i][0],i) for i in range(len(references)))
+	header = {'HD':{'VN':'1.0','SO':'coordinate'},'SQ':[{'SN':name,'LN':length} for name,length in references]}
+	
+	with pysam.AlignmentFile(bam_file,"wb",header=header) as fh:
+		for i,(name,start,stop) in enumerate(sorted(reads,key=lambda read: (reference_ids[read[0]],read[1],read[2]))):
+			read = pysam.AlignedSegment()
+			read.query_name = "read_"+str(i)
+			read.reference_id = reference_ids[name]
+			read.reference_start = start
+			read.cigarstring = str(stop - start + 1)+"M"
+			read.query_sequence = sequences[name][start:stop + 1]
+			read.mapping_quality = 255
+			fh.write(read)
+	pysam.index(bam_file)
+	
+	return (bam_file,fasta_file,gtf_file)
+
+def random_reads(rng,name,start,stop,fragments,depth):
+	"""Simulates the reads of fragments at random positions of a region,
+	with a little variation in their start and stop positions.
+	
+	----
+	@return: list of (reference name, start, stop) tuples
+	@rtype: list
+	"""
+	reads = []
+	for i in range(fragments):
+		fragment_start = rng.randint(start,stop)
+		fragment_length = rng.randint(18,30)
+		
+		for j in range(rng.randint(1,depth)):
+			read_start = max(0,fragment_start + rng.choice([-1,0,0,0,1]))
+			reads.append((name,read_start,read_start + fragment_length + rng.choice([-1,0,0,0,1])))
+	
+	return reads
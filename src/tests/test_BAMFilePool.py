@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+"""FlaiMapper: computational annotation of small ncRNA derived fragments using RNA-seq high throughput data
+
+ Here we present Fragment Location Annotation Identification mapper
+ (FlaiMapper), a method that extracts and annotates the locations of
+ sncRNA-derived RNAs (sncdRNAs). These sncdRNAs are often detected in
+ sequencing data and observed as fragments of their  precursor sncRNA.
+ Using small RNA-seq read alignments, FlaiMapper is able to annotate
+ fragments primarily by peak-detection on the start and  end position
+ densities followed by filtering and a reconstruction processes.
+ Copyright (C) 2011-2014:
+ - Youri Hoogstrate
+ - Elena S. Martens-Uzunova
+ - Guido Jenster
+ 
+ 
+ [License: GPL3]
+ 
+ This file is part of flaimapper.
+ 
+ flaimapper is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ flaimapper is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+
+import unittest,shutil,tempfile,os,sys,StringIO
+import pysam
+
+
+from flaimapper.BAMFilePool import BAMFilePool, requires_index, index_alignment, index_alignments
+
+from tests.synthetic import write_alignments
+
+
+class TestBAMFilePool(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		
+		reads = [("chr1",i * 10,i * 10 + 20) for i in range(50)]
+		self.bam_file = write_alignments(self.directory,[("chr1",1000)],reads,[("chr1",0,999,"+")])[0]
+		
+		# A copy of which the index is missing
+		self.unindexed = os.path.join(self.directory,"unindexed.bam")
+		shutil.copy(self.bam_file,self.unindexed)
+	
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+	
+	def write_unsorted(self):
+		"""Writes a BAM file that can not be indexed because it is not
+		sorted by coordinate.
+		"""
+		bam_file = os.path.join(self.directory,"unsorted.bam")
+		with pysam.AlignmentFile(bam_file,"wb",header={'HD':{'VN':'1.0'},'SQ':[{'SN':'chr1','LN':1000}]}) as fh:
+			for start in [500,100]:
+				read = pysam.AlignedSegment()
+				read.query_name = "read_"+str(start)
+				read.reference_id = 0
+				read.reference_start = start
+				read.cigarstring = "20M"
+				read.query_sequence = "A" * 20
+				fh.write(read)
+		
+		return bam_file
+	
+	def index_alignments(self,alignments,threads=1):
+		"""Runs index_alignments() and returns what it writes to stderr
+		if it exits.
+		"""
+		stderr = sys.stderr
+		sys.stderr = StringIO.StringIO()
+		try:
+			index_alignments(alignments,threads)
+		except SystemExit:
+			return sys.stderr.getvalue()
+		finally:
+			sys.stderr = stderr
+		
+		return None
+	
+	def test_missing_index(self):
+		self.assertFalse(requires_index(self.bam_file))
+		self.assertTrue(requires_index(self.unindexed))
+		
+		self.assertEqual(index_alignments([self.bam_file,self.unindexed]),[self.unindexed])
+		self.assertTrue(os.path.isfile(self.unindexed+".bai"))
+		self.assertFalse(requires_index(self.unindexed))
+		self.assertEqual(index_alignments([self.bam_file,self.unindexed]),[])
+	
+	def test_stale_index(self):
+		"""An index that is older than its BAM file is rebuilt."""
+		mtime = os.path.getmtime(self.bam_file)
+		os.utime(self.bam_file+".bai",(mtime - 60,mtime - 60))
+		self.assertTrue(requires_index(self.bam_file))
+		
+		self.assertEqual(index_alignments([self.bam_file]),[self.bam_file])
+		self.assertFalse(requires_index(self.bam_file))
+	
+	def test_parallel(self):
+		alignments = [self.unindexed]
+		for i in range(3):
+			alignments.append(os.path.join(self.directory,"copy_"+str(i)+".bam"))
+			shutil.copy(self.bam_file,alignments[-1])
+		
+		self.assertEqual(index_alignments([self.bam_file] + alignments,3),alignments)
+		for bam_file in alignments:
+			self.assertFalse(requires_index(bam_file))
+			self.assertEqual(len(list(pysam.AlignmentFile(bam_file).fetch("chr1",0,100))),10)
+	
+	def test_errors(self):
+		"""Indexing errors are reported by the parent process, also if the
+		indices are built in parallel.
+		"""
+		unsorted = self.write_unsorted()
+		
+		self.assertIn(unsorted,index_alignment(unsorted))
+		self.assertIsNone(index_alignment(self.unindexed))
+		
+		os.remove(self.unindexed+".bai")
+		for threads in [1,2]:
+			error = self.index_alignments([self.unindexed,unsorted],threads)
+			self.assertIsNotNone(error)
+			self.assertIn(unsorted,error)
+			self.assertNotIn(self.unindexed,error)
+		
+		self.assertIsNone(self.index_alignments([self.bam_file]))
+		
+		# The fallback of the BAMFilePool raises the error
+		self.assertRaises(IOError,BAMFilePool,[self.bam_file,unsorted],"quiet")
+	
+	def test_fallback(self):
+		"""The BAMFilePool builds a missing index itself."""
+		pool = BAMFilePool([self.unindexed],"quiet")
+		self.assertEqual(len(list(pool.fetch("chr1",0,100))),10)
+		self.assertEqual(len(list(pool.fetch("chr2",0,100))),0)
+		pool.close()
+		
+		self.assertFalse(requires_index(self.unindexed))
+
+
+if __name__ == '__main__':
+	unittest.main()
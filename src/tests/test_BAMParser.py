@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""FlaiMapper: computational annotation of small ncRNA derived fragments using RNA-seq high throughput data
+
+ Here we present Fragment Location Annotation Identification mapper
+ (FlaiMapper), a method that extracts and annotates the locations of
+ sncRNA-derived RNAs (sncdRNAs). These sncdRNAs are often detected in
+ sequencing data and observed as fragments of their  precursor sncRNA.
+ Using small RNA-seq read alignments, FlaiMapper is able to annotate
+ fragments primarily by peak-detection on the start and  end position
+ densities followed by filtering and a reconstruction processes.
+ Copyright (C) 2011-2014:
+ - Youri Hoogstrate
+ - Elena S. Martens-Uzunova
+ - Guido Jenster
+ 
+ 
+ [License: GPL3]
+ 
+ This file is part of flaimapper.
+ 
+ flaimapper is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ flaimapper is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+
+import unittest,random,shutil,tempfile,os
+
+
+from flaimapper.BAMParser import BAMParser
+
+from tests.synthetic import write_alignments,random_reads
+
+
+class TestBAMParser(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		
+		# Two sorted BAM files, of which the reads are merged
+		rng = random.Random(18)
+		self.alignments = []
+		for i in range(2):
+			directory = os.path.join(self.directory,str(i))
+			os.mkdir(directory)
+			
+			reads = random_reads(rng,"chr1",0,900,30,20) + random_reads(rng,"chr2",0,900,10,20)
+			self.alignments.append(write_alignments(directory,[("chr1",1000),("chr2",1000)],reads,[])[0])
+	
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+	
+	def get_stacked(self,stacked_reads):
+		return [(read.start,read.stop,count) for read,count in stacked_reads]
+	
+	def test_stack_sorted_reads(self):
+		"""Stacking the sorted reads while streaming must give the same
+		result as stacking the parsed pairs.
+		"""
+		for name,start,stop in [("chr1",0,999),("chr1",100,199),("chr1",500,520),("chr2",0,999),("chr3",0,999)]:
+			parser = BAMParser(name,start,stop,self.alignments,"quiet")
+			sorted_reads = parser.parse_sorted_reads()
+			self.assertIsNotNone(sorted_reads)
+			streamed = self.get_stacked(parser.stack_sorted_reads(sorted_reads))
+			
+			parser = BAMParser(name,start,stop,self.alignments,"quiet")
+			self.assertEqual(self.get_stacked(parser.parse_reads_stacked()),streamed)
+			self.assertEqual(self.get_stacked(parser.stack_read_pairs()),streamed)
+			
+			if(name != "chr3"):
+				self.assertGreater(len(streamed),0)
+				self.assertEqual(streamed,sorted(streamed))
+				self.assertGreater(sum([count for read_start,read_stop,count in streamed]),len(streamed))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+"""FlaiMapper: computational annotation of small ncRNA derived fragments using RNA-seq high throughput data
+
+ Here we present Fragment Location Annotation Identification mapper
+ (FlaiMapper), a method that extracts and annotates the locations of
+ sncRNA-derived RNAs (sncdRNAs). These sncdRNAs are often detected in
+ sequencing data and observed as fragments of their  precursor sncRNA.
+ Using small RNA-seq read alignments, FlaiMapper is able to annotate
+ fragments primarily by peak-detection on the start and  end position
+ densities followed by filtering and a reconstruction processes.
+ Copyright (C) 2011-2014:
+ - Youri Hoogstrate
+ - Elena S. Martens-Uzunova
+ - Guido Jenster
+ 
+ 
+ [License: GPL3]
+ 
+ This file is part of flaimapper.
+ 
+ flaimapper is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ flaimapper is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+
+import unittest,random,shutil,tempfile,os
+import pysam
+
+
+from flaimapper.FlaiMapperObject import FlaiMapperObject
+from flaimapper.utils import parse_gff
+
+from tests.synthetic import write_alignments,random_reads
+
+
+class TestFlaiMapperObject(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		
+		rng = random.Random(20)
+		reads = random_reads(rng,"chr1",0,1900,40,300) + random_reads(rng,"chr1",3000,3900,20,10) + random_reads(rng,"chr2",0,900,10,40)
+		
+		self.bam_file,self.fasta_file,self.gtf_file = write_alignments(self.directory,[("chr1",5000),("chr2",1000)],reads,[("chr1",0,1999,"+"),("chr1",3000,3999,"-"),("chr1",3500,3599,"+"),("chr2",0,999,"-")])
+	
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+	
+	def get_flaimapper(self,max_depth=0):
+		flaimapper = FlaiMapperObject('bam','quiet')
+		flaimapper.add_alignment(self.bam_file)
+		flaimapper.set_max_depth(max_depth)
+		
+		return flaimapper
+	
+	def read(self,filename):
+		with open(os.path.join(self.directory,filename)) as fh:
+			return fh.read()
+	
+	def detect(self,filename,max_depth=0,sweep=False):
+		flaimapper = self.get_flaimapper(max_depth)
+		flaimapper.run(parse_gff(self.gtf_file),pysam.FastaFile(self.fasta_file),1,sweep)
+		flaimapper.export([(1,os.path.join(self.directory,filename))])
+		flaimapper.write_depth_report(os.path.join(self.directory,filename+".report"))
+		
+		return (self.read(filename),self.read(filename+".report"))
+	
+	def test_threads(self):
+		"""A pool of worker processes must give the same results, in the
+		same order, as a single process.
+		"""
+		class OrderedFlaiMapperObject(FlaiMapperObject):
+			def add_fragments(self,predicted_fragments,fasta_file=None):
+				self.order.append(predicted_fragments.masked_region)
+				FlaiMapperObject.add_fragments(self,predicted_fragments,fasta_file)
+		
+		regions = parse_gff(self.gtf_file)
+		
+		results = []
+		for threads in [1,3]:
+			flaimapper = OrderedFlaiMapperObject('bam','quiet')
+			flaimapper.add_alignment(self.bam_file)
+			flaimapper.order = []
+			flaimapper.run(regions,pysam.FastaFile(self.fasta_file),threads)
+			flaimapper.write(1,os.path.join(self.directory,str(threads)+".txt"))
+			
+			results.append((flaimapper.order,self.read(str(threads)+".txt")))
+		
+		self.assertEqual(results[0][0],regions)
+		self.assertEqual(results[1],results[0])
+	
+	def test_region_edges(self):
+		"""Reads that start before a masked region or end after it are
+		counted entirely.
+		"""
+		directory = os.path.join(self.directory,"edges")
+		os.mkdir(directory)
+		
+		reads = [("chr1",995,1016)] * 300 + [("chr1",2996,3018)] * 300
+		bam_file,fasta_file,gtf_file = write_alignments(directory,[("chr1",5000)],reads,[("chr1",1000,1099,"+"),("chr1",2950,2999,"+")])
+		
+		flaimapper = FlaiMapperObject('bam','quiet')
+		flaimapper.add_alignment(bam_file)
+		flaimapper.run(parse_gff(gtf_file),pysam.FastaFile(fasta_file))
+		flaimapper.write(1,os.path.join(directory,"fragments.txt"))
+		
+		fragments = [line.split("\t") for line in self.read("edges/fragments.txt").strip().split("\n")[1:]]
+		self.assertEqual([fragment[2:8] + fragment[9:12] for fragment in fragments],[
+			["chr1","995","1016","precursor_0","-5","16","300","300","600"],
+			["chr1","2996","3018","precursor_1","46","68","300","300","600"]])
+	
+	def test_max_depth(self):
+		"""Only the deep masked region is downsampled, with the same sample
+		whether its reads are fetched or swept.
+		"""
+		table,report = self.detect("fetched.txt",500)
+		
+		self.assertEqual(len(report.strip().split("\n")),2)
+		self.assertTrue(report.split("\n")[1].startswith("chr1\t0\t1999\t"))
+		self.assertEqual(self.detect("swept.txt",500,True),(table,report))
+		
+		# A max_depth above the depth of all masked regions has no effect
+		self.assertEqual(self.detect("deep.txt",10 ** 6)[0],self.detect("exact.txt")[0])
+
+	
+	def get_outputs(self,prefix):
+		return [(1,os.path.join(self.directory,prefix+".txt")),(2,os.path.join(self.directory,prefix+".ncrna.txt")),(4,os.path.join(self.directory,prefix+".gtf")),(6,os.path.join(self.directory,prefix+".bed.gz"))]
+	
+	def read_outputs(self,prefix):
+		return [self.read(os.path.basename(filename)) for export_format,filename in self.get_outputs(prefix)[0:3]] + [pysam.BGZFile(self.get_outputs(prefix)[3][1]).read()]
+	
+	def test_stream(self):
+		"""Streaming the results must give the same output as exporting
+		them at once.
+		"""
+		regions = parse_gff(self.gtf_file)
+		fasta_file = pysam.FastaFile(self.fasta_file)
+		
+		flaimapper = self.get_flaimapper()
+		flaimapper.run(regions,fasta_file)
+		flaimapper.export(self.get_outputs("exported"))
+		exported = self.read_outputs("exported")
+		
+		flaimapper = self.get_flaimapper()
+		flaimapper.open_stream(self.get_outputs("streamed"),regions)
+		flaimapper.run(regions,fasta_file,2)
+		flaimapper.close_stream()
+		
+		self.assertEqual(self.read_outputs("streamed"),exported)
+		
+		# The results of the BAMSweeper are written in order of arrival
+		flaimapper = self.get_flaimapper()
+		flaimapper.open_stream(self.get_outputs("swept"),regions,False)
+		flaimapper.run(regions,fasta_file,1,True)
+		flaimapper.close_stream()
+		
+		swept = self.read_outputs("swept")
+		for i in range(2):
+			self.assertEqual(sorted(swept[i].split("\n")),sorted(exported[i].split("\n")))
+		self.assertEqual(swept[2:],exported[2:])
+	
+	def test_stream_genbank(self):
+		self.assertRaises(ValueError,self.get_flaimapper().open_stream,[(3,os.path.join(self.directory,"fragments.gbk"))],parse_gff(self.gtf_file))
+
+if __name__ == '__main__':
+	unittest.main()
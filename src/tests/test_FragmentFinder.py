@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+"""FlaiMapper: computational annotation of small ncRNA derived fragments using RNA-seq high throughput data
+
+ Here we present Fragment Location Annotation Identification mapper
+ (FlaiMapper), a method that extracts and annotates the locations of
+ sncRNA-derived RNAs (sncdRNAs). These sncdRNAs are often detected in
+ sequencing data and observed as fragments of their  precursor sncRNA.
+ Using small RNA-seq read alignments, FlaiMapper is able to annotate
+ fragments primarily by peak-detection on the start and  end position
+ densities followed by filtering and a reconstruction processes.
+ Copyright (C) 2011-2014:
+ - Youri Hoogstrate
+ - Elena S. Martens-Uzunova
+ - Guido Jenster
+ 
+ 
+ [License: GPL3]
+ 
+ This file is part of flaimapper.
+ 
+ flaimapper is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ flaimapper is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+
+import unittest,random
+import numpy
+
+
+from flaimapper.FragmentFinder import FragmentFinder
+
+
+def correct_neighbour_peaks_quadratic(plist):
+	"""The original neighbour peak filter, which compares every pair of
+	peaks.
+	"""
+	psorted = sorted(plist.iteritems(),key=lambda item: item[1])[::-1]
+	
+	for i in range(len(psorted)):
+		if(psorted[i] != False):
+			item = psorted[i]
+			for j in range(len(psorted)):
+				if((psorted[j] != False) and (j != i)):
+					item2 = psorted[j]
+					diff = item2[0]-item[0]
+					if(FragmentFinder.pmatrix.has_key(diff)):
+						perc = FragmentFinder.pmatrix[diff]/100.0
+						if((perc*item[1]) > item2[1]):
+							psorted[j] = False
+	
+	return dict([item for item in psorted if item != False])
+
+
+def find_partner_peak_linear(predictedPos,peaks,positions):
+	"""Finds the partner peak by scanning all available peaks, in the
+	iteration order of peaks.
+	"""
+	partner = None
+	highest = 0
+	for item in peaks:
+		if((item in positions) and (item >= predictedPos-15) and (item <= predictedPos+15)):
+			score = peaks[item]*(1.0 - (abs(predictedPos - item) * 0.09))
+			if(score >= highest):
+				highest = peaks[item]
+				partner = item
+	
+	return partner
+
+
+def find_fragments_original(pstart,pstop,pexpectedStart,pexpectedStop):
+	"""The original tracing, with the peaks and the expected lengths
+	indexed by their position in the reference sequence.
+	
+	----
+	@return: (start, stop) of each fragment
+	@rtype: list
+	"""
+	fragments = []
+	removed = set()												# Instead of deleting the peaks, which may not be copied
+	
+	if(len(pstart) >= len(pstop)):
+		for pos,height in sorted(pstop.iteritems(),key=lambda item: item[1])[::-1]:
+			predictedPos = pos+pexpectedStop[pos]+1
+			fragment = None
+			highest = 0
+			for item in [s for s in pstart if ((s >= predictedPos-15) and (s <= predictedPos+15) and (s not in removed))]:
+				score = pstart[item]*(1.0 - (abs(predictedPos - item) * 0.09))
+				if(score >= highest):
+					highest = pstart[item]
+					fragment = (item,pos)
+			
+			if(fragment != None):
+				fragments.append(fragment)
+				removed.add(fragment[0])
+	else:
+		for pos,height in sorted(pstart.iteritems(),key=lambda item: item[1])[::-1]:
+			predictedPos = pos+pexpectedStart[pos]
+			fragment = None
+			highest = 0
+			for item in [s for s in pstop if ((s >= predictedPos-15) and (s <= predictedPos+15) and (s not in removed))]:
+				score = pstop[item]*(1.0 - (abs(predictedPos - item) * 0.09))
+				if(score >= highest):
+					highest = pstop[item]
+					fragment = (pos,item)
+			
+			if(fragment != None):
+				fragments.append(fragment)
+				removed.add(fragment[1])
+	
+	return fragments
+
+
+class TestFragmentFinder(unittest.TestCase):
+	def get_finder(self,engine="numpy",offset=0):
+		finder = FragmentFinder(("ref",0,999,0,"precursor",0),None,False,engine)
+		finder.offset = offset
+		
+		return finder
+	
+	def random_counts(self,rng,n):
+		return [rng.choice([0,0,1,2,3,5,5,8,20]) for i in range(n)]
+	
+	def test_find_peaks(self):
+		"""The vectorized peak detection must find the same peaks as the
+		original implementation.
+		"""
+		finder = self.get_finder()
+		
+		self.assertEqual(finder.findPeaks([0,5,5,5,2,0,1,0,0]),{1:5,6:1})
+		self.assertEqual(finder.findPeaks([0,3,7,2,9,9,0]),{2:7,4:9})
+		
+		rng = random.Random(11)
+		for trial in range(2000):
+			plist = self.random_counts(rng,rng.randint(0,40))
+			
+			for drop_cutoff in [0.1,0.5,1.0,2.0]:
+				positions,heights = finder.find_peaks(numpy.array(plist,dtype=numpy.int64),drop_cutoff)
+				
+				self.assertEqual(positions.tolist(),sorted(positions.tolist()))
+				self.assertEqual(dict(zip(positions.tolist(),heights.tolist())),finder.findPeaks(plist,drop_cutoff))
+	
+	def test_get_peaks(self):
+		"""A peak at the last position is found by both engines, and the
+		peaks are indexed by their position in the reference sequence.
+		"""
+		plist = numpy.array([1,2,3,4,5],dtype=numpy.int64)
+		
+		self.assertEqual(self.get_finder("numpy").get_peaks(plist),{4:5})
+		self.assertEqual(self.get_finder("python").get_peaks(plist),{4:5})
+		self.assertEqual(self.get_finder("numpy",100).get_peaks(plist),{104:5})
+		self.assertEqual(self.get_finder("python",100).get_peaks(plist),{104:5})
+	
+	def test_correct_neighbour_peaks(self):
+		"""Only the peaks within the range of pmatrix are compared, which
+		must give the same result as comparing all peaks.
+		"""
+		finder = self.get_finder()
+		
+		self.assertEqual(finder.correctNeighbourPeaks({10:100,12:50,16:30,40:5}),{10:100,16:30,40:5})
+		
+		rng = random.Random(12)
+		for trial in range(500):
+			n = rng.choice([20,100,1000])
+			plist = dict((rng.randint(0,n),rng.choice([1,2,3,5,10,50,100,1000])) for i in range(rng.randint(0,40)))
+			
+			self.assertEqual(finder.correctNeighbourPeaks(plist),correct_neighbour_peaks_quadratic(plist))
+	
+	def test_find_fragments(self):
+		finder = self.get_finder()
+		
+		expected_start = numpy.full(100,numpy.nan)
+		expected_stop = numpy.full(100,numpy.nan)
+		expected_start[[10,40]] = 20
+		expected_stop[[29,59]] = -20
+		
+		# More start than stop peaks: the partners of the stop peaks
+		fragments = finder.find_fragments({110:50,140:30},{129:50,159:30},expected_start,expected_stop,genomic_offset_masked_region=100)
+		self.assertEqual([(fragment['start'],fragment['stop'],fragment.supporting_reads_start,fragment.supporting_reads_stop) for fragment in fragments],[(110,129,50,50),(140,159,30,30)])
+		self.assertEqual([(fragment.start,fragment.stop) for fragment in fragments],[(10,29),(40,59)])
+		
+		# More stop than start peaks: the partners of the start peaks
+		fragments = finder.find_fragments({10:50,40:30},{29:50,59:30,80:2},expected_start,expected_stop)
+		self.assertEqual([(fragment.start,fragment.stop) for fragment in fragments],[(10,29),(40,59)])
+	
+	def test_find_fragments_shifted(self):
+		"""The expected lengths are relative to the masked region, while
+		the peaks are indexed by their position in the reference
+		sequence. The fragments, including the ties among the peaks,
+		must be the same as those of the original tracing, in which both
+		were indexed by their position in the reference sequence.
+		"""
+		finder = self.get_finder()
+		
+		rng = random.Random(5)
+		for trial in range(500):
+			n = rng.choice([40,100,300])
+			offset = rng.choice([0,1,7,1000,123457])
+			
+			pstart = dict((offset + rng.randint(0,n-1),rng.choice([1,2,3,5,5,10])) for i in range(rng.randint(0,25)))
+			pstop = dict((offset + rng.randint(0,n-1),rng.choice([1,2,3,5,5,10])) for i in range(rng.randint(0,25)))
+			expected_start = numpy.array([rng.choice([18,20,22]) for i in range(n)])
+			expected_stop = numpy.array([rng.choice([-18,-20,-22]) for i in range(n)])
+			
+			fragments = finder.find_fragments(pstart,pstop,expected_start,expected_stop,genomic_offset_masked_region=offset)
+			original = find_fragments_original(pstart,pstop,numpy.concatenate((numpy.zeros(offset),expected_start)),numpy.concatenate((numpy.zeros(offset),expected_stop)))
+			
+			self.assertEqual([(fragment['start'],fragment['stop']) for fragment in fragments],original)
+	
+	def test_find_partner_peak(self):
+		"""The candidates found by bisection must give the same partner as
+		scanning all peaks.
+		"""
+		finder = self.get_finder()
+		
+		rng = random.Random(13)
+		for trial in range(2000):
+			peaks = dict((rng.randint(0,200),rng.choice([1,2,3,5,10])) for i in range(rng.randint(0,30)))
+			order = dict((s,i) for i,s in enumerate(peaks))
+			positions = sorted([pos for pos in peaks if rng.random() < 0.8])
+			predictedPos = rng.randint(-20,220)
+			
+			self.assertEqual(finder.find_partner_peak(predictedPos,peaks,positions,order),find_partner_peak_linear(predictedPos,peaks,positions))
+	
+	def test_engine(self):
+		self.assertRaises(ValueError,FragmentFinder,("ref",0,999,0,"precursor",0),None,False,"fortran")
+
+
+if __name__ == '__main__':
+	unittest.main()
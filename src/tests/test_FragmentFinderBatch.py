@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+"""FlaiMapper: computational annotation of small ncRNA derived fragments using RNA-seq high throughput data
+
+ Here we present Fragment Location Annotation Identification mapper
+ (FlaiMapper), a method that extracts and annotates the locations of
+ sncRNA-derived RNAs (sncdRNAs). These sncdRNAs are often detected in
+ sequencing data and observed as fragments of their  precursor sncRNA.
+ Using small RNA-seq read alignments, FlaiMapper is able to annotate
+ fragments primarily by peak-detection on the start and  end position
+ densities followed by filtering and a reconstruction processes.
+ Copyright (C) 2011-2014:
+ - Youri Hoogstrate
+ - Elena S. Martens-Uzunova
+ - Guido Jenster
+ 
+ 
+ [License: GPL3]
+ 
+ This file is part of flaimapper.
+ 
+ flaimapper is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ flaimapper is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+
+import unittest,random
+import numpy
+
+
+from flaimapper.MaskedRegion import MaskedRegion
+from flaimapper.FragmentFinder import FragmentFinder
+from flaimapper.FragmentFinderBatch import FragmentFinderBatch
+
+
+class TestFragmentFinderBatch(unittest.TestCase):
+	def get_batch(self,rng):
+		"""Masked regions with reads clustered around a few fragments."""
+		batch = []
+		for i in range(rng.randint(0,20)):
+			start = rng.randint(0,100000)
+			length = rng.choice([1,5,80,150,1000])
+			
+			starts = []
+			stops = []
+			for j in range(rng.randint(0,5)):
+				fragment_start = rng.randint(-10,length)
+				fragment_length = rng.randint(15,30)
+				for k in range(rng.choice([1,3,30,300])):
+					starts.append(start + fragment_start + rng.randint(-2,2))
+					stops.append(starts[-1] + fragment_length + rng.randint(-2,2))
+			
+			region = MaskedRegion("ref",start,start + length - 1,None,"quiet")
+			region.reset()
+			region.add_reads(numpy.array(starts,dtype=numpy.int64),numpy.array(stops,dtype=numpy.int64))
+			region.summarize_stats()
+			
+			batch.append((("ref",start,start + length - 1,0,"precursor_"+str(i),i,"+"),region))
+		
+		return batch
+	
+	def get_key(self,finder):
+		return (finder.peaksStart,finder.correctedPeaksStart,finder.peaksStop,finder.correctedPeaksStop,[(fragment['start'],fragment['stop'],fragment.supporting_reads_start,fragment.supporting_reads_stop) for fragment in finder.results])
+	
+	def test_run(self):
+		"""Detecting the fragments of a batch of masked regions at once must
+		give the same results as detecting them per masked region.
+		"""
+		rng = random.Random(14)
+		for trial in range(100):
+			batch = self.get_batch(rng)
+			
+			finders = FragmentFinderBatch().run(batch)
+			self.assertEqual(len(finders),len(batch))
+			
+			for finder,(masked_region,region) in zip(finders,batch):
+				self.assertEqual(finder.masked_region,masked_region)
+				self.assertEqual(self.get_key(finder),self.get_key(FragmentFinder(masked_region,region)))
+				self.assertEqual(self.get_key(finder),self.get_key(FragmentFinder(masked_region,region,engine="python")))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+
+"""FlaiMapper: computational annotation of small ncRNA derived fragments using RNA-seq high throughput data
+
+ Here we present Fragment Location Annotation Identification mapper
+ (FlaiMapper), a method that extracts and annotates the locations of
+ sncRNA-derived RNAs (sncdRNAs). These sncdRNAs are often detected in
+ sequencing data and observed as fragments of their  precursor sncRNA.
+ Using small RNA-seq read alignments, FlaiMapper is able to annotate
+ fragments primarily by peak-detection on the start and  end position
+ densities followed by filtering and a reconstruction processes.
+ Copyright (C) 2011-2014:
+ - Youri Hoogstrate
+ - Elena S. Martens-Uzunova
+ - Guido Jenster
+ 
+ 
+ [License: GPL3]
+ 
+ This file is part of flaimapper.
+ 
+ flaimapper is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ flaimapper is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+
+import unittest,random
+import numpy
+
+
+from flaimapper.MaskedRegion import MaskedRegion
+from flaimapper.Read import Read
+from flaimapper.ncRNAfragment import ncRNAfragment
+
+
+def summarize_stats_naive(length,reads):
+	"""The original statistics, with a list of read lengths per position.
+	
+	----
+	@param reads: (start, stop) tuples relative to the masked region
+	"""
+	length = max([length] + [stop + 1 for start,stop in reads])
+	start_lengths = [[] for i in range(length)]
+	stop_lengths = [[] for i in range(length)]
+	
+	for start,stop in reads:
+		start_lengths[start].append(stop - start)
+		stop_lengths[stop].append(start - stop)
+	
+	start_avg_lengths = []
+	stop_avg_lengths = []
+	for i in range(length):
+		avgLenF = numpy.median(start_lengths[i]) if start_lengths[i] else None
+		avgLenR = numpy.median(stop_lengths[i]) if stop_lengths[i] else None
+		start_avg_lengths.append(round(avgLenF+1) if avgLenF else avgLenF)
+		stop_avg_lengths.append(round(avgLenR-0.5) if avgLenR else avgLenR)
+	
+	return [[len(lengths) for lengths in start_lengths],[len(lengths) for lengths in stop_lengths],start_avg_lengths,stop_avg_lengths]
+
+
+class TestMaskedRegion(unittest.TestCase):
+	def get_region(self,start,stop,starts,stops,weights=None,max_depth=0,batch_size=None):
+		region = MaskedRegion("ref",start,stop,None,"quiet")
+		region.set_max_depth(max_depth)
+		region.reset()
+		
+		if(batch_size is None):
+			batch_size = max(1,len(starts))
+		for i in range(0,len(starts),batch_size):
+			region.add_reads(numpy.array(starts[i:i + batch_size],dtype=numpy.int64),numpy.array(stops[i:i + batch_size],dtype=numpy.int64),None if weights is None else numpy.array(weights[i:i + batch_size],dtype=numpy.int64))
+		region.finish_reads()
+		
+		return region
+	
+	def get_pairs(self,region):
+		return [column.tolist() for column in region.get_read_pairs()]
+	
+	def test_get_medians(self):
+		region = MaskedRegion("ref",0,9,None,"quiet")
+		
+		positions = numpy.array([1,1,1,4,4],dtype=numpy.int64)
+		lengths = numpy.array([20,21,30,18,22],dtype=numpy.int64)
+		counts = numpy.array([2,1,1,1,1],dtype=numpy.int64)
+		totals = numpy.array([0,4,0,0,2,0],dtype=numpy.int64)
+		
+		medians = region.get_medians(positions,lengths,counts,totals)
+		
+		self.assertEqual(medians[[1,4]].tolist(),[20.5,20.0])
+		self.assertTrue(numpy.isnan(medians[[0,2,3,5]]).all())
+	
+	def test_summarize_stats(self):
+		"""The statistics derived from the pair counts must be the same as
+		those derived from the individual reads.
+		"""
+		rng = random.Random(16)
+		for trial in range(200):
+			length = rng.choice([1,10,100])
+			reads = []
+			for i in range(rng.randint(0,300)):
+				start = rng.randint(0,length + 5)
+				reads.append((start,start + rng.choice([0,1,17,18,18,19,22,25])))
+			
+			region = self.get_region(1000,1000 + length - 1,[1000 + start for start,stop in reads],[1000 + stop for start,stop in reads])
+			
+			for x,y in zip(region.summarize_stats(),summarize_stats_naive(length,reads)):
+				self.assertEqual(len(x),len(y))
+				for a,b in zip(x,y):
+					if(b is None):
+						self.assertTrue(numpy.isnan(a))
+					else:
+						self.assertEqual(a,b)
+	
+	def test_count_reads_per_region(self):
+		"""Only the reads that lie entirely within a fragment support it."""
+		rng = random.Random(15)
+		for trial in range(200):
+			masked_region = ("ref",500,599,0,"precursor",0,"+")
+			
+			starts = [rng.randint(490,600) for i in range(rng.randint(0,200))]
+			stops = [start + rng.choice([0,5,18,22,30]) for start in starts]
+			weights = [rng.choice([1,1,2,10]) for start in starts]
+			
+			fragments = []
+			for i in range(rng.randint(0,5)):
+				start = rng.randint(-15,90)
+				fragments.append(ncRNAfragment(start,start + rng.randint(0,40),None,masked_region,500))
+			
+			region = self.get_region(500,599,starts,stops,weights)
+			region.count_reads_per_region(fragments)
+			
+			for fragment in fragments:
+				spanning = sum([weight for start,stop,weight in zip(starts,stops,weights) if start >= fragment['start'] and stop <= fragment['stop']])
+				self.assertEqual(fragment.supporting_reads,spanning)
+	
+	def test_downsampling_shallow(self):
+		"""Masked regions with at most max_depth reads are not downsampled."""
+		rng = random.Random(20)
+		starts = [rng.randint(0,100) for i in range(300)]
+		stops = [start + rng.randint(15,25) for start in starts]
+		
+		region = self.get_region(0,99,starts,stops)
+		sampled = self.get_region(0,99,starts,stops,max_depth=300,batch_size=7)
+		
+		self.assertEqual(sampled.downsampling,None)
+		self.assertEqual(self.get_pairs(sampled),self.get_pairs(region))
+	
+	def test_downsampling(self):
+		"""The sample of a deep masked region must not depend on the order
+		of the reads or the size of the batches in which they arrive.
+		"""
+		rng = random.Random(20)
+		reads = []
+		for i in range(20000):
+			start = rng.choice([10,10,10,11,40,41,70])
+			reads.append((start,start + rng.choice([17,18,18,22]),rng.choice([1,1,1,3])))
+		
+		starts,stops,weights = zip(*reads)
+		region = self.get_region(0,99,starts,stops,weights,max_depth=500)
+		
+		alignments,sampled,scale = region.downsampling
+		self.assertEqual(alignments,20000)
+		self.assertTrue(0 < sampled <= 500)
+		self.assertEqual(sum(self.get_pairs(region)[2]) % scale,0)
+		
+		# The scaled counts are an estimate of the actual counts
+		total = sum(weights)
+		self.assertTrue(0.7 * total < sum(self.get_pairs(region)[2]) < 1.3 * total)
+		
+		for batch_size in [1000,333]:
+			rng.shuffle(reads)
+			starts,stops,weights = zip(*reads)
+			shuffled = self.get_region(0,99,starts,stops,weights,max_depth=500,batch_size=batch_size)
+			
+			self.assertEqual(shuffled.downsampling,region.downsampling)
+			self.assertEqual(self.get_pairs(shuffled),self.get_pairs(region))
+	
+	def test_buffers(self):
+		"""A read buffer is only taken from the pool by add_read() and is
+		returned afterwards, also if parsing fails. The pool keeps at
+		most max_buffers buffers.
+		"""
+		class FailingRegion(MaskedRegion):
+			def parse_read_batches(self,batch_size=MaskedRegion.buffer_size):
+				self.add_read(Read(10,30))
+				raise IOError("Truncated file")
+		
+		buffers = MaskedRegion.buffers
+		MaskedRegion.buffers = []
+		try:
+			region = MaskedRegion("ref",0,99,None,"quiet")
+			region.reset()
+			self.assertIsNone(region.buffer)
+			
+			region.add_read(Read(10,30))
+			region.add_read(Read(10,30,weight=2))
+			self.assertEqual(region.buffer.shape,(3,MaskedRegion.buffer_size))
+			
+			region.finish_reads()
+			self.assertIsNone(region.buffer)
+			self.assertEqual(len(MaskedRegion.buffers),1)
+			self.assertEqual(self.get_pairs(region),[[10],[30],[3]])
+			
+			self.assertRaises(IOError,FailingRegion("ref",0,99,None,"quiet").get_read_pairs)
+			self.assertEqual(len(MaskedRegion.buffers),1)
+			
+			regions = [MaskedRegion("ref",0,99,None,"quiet") for i in range(MaskedRegion.max_buffers + 2)]
+			for region in regions:
+				region.reset()
+				region.add_read(Read(10,30))
+			self.assertEqual(len(MaskedRegion.buffers),0)
+			
+			for region in regions:
+				region.finish_reads()
+			self.assertEqual(len(MaskedRegion.buffers),MaskedRegion.max_buffers)
+		finally:
+			MaskedRegion.buffers = buffers
+	
+	def test_summarize_stats_edges(self):
+		"""Reads that start before the masked region move the origin of
+		the statistics to their start, reads that end after it extend
+		the statistics up to their stop.
+		"""
+		region = self.get_region(100,129,[95,110,120],[104,119,140])
+		start_positions,stop_positions,start_avg_lengths,stop_avg_lengths = region.summarize_stats()
+		
+		self.assertEqual(region.origin,95)
+		self.assertEqual(len(start_positions),46)
+		self.assertEqual(numpy.flatnonzero(start_positions).tolist(),[0,15,25])
+		self.assertEqual(numpy.flatnonzero(stop_positions).tolist(),[9,24,45])
+		self.assertEqual(start_avg_lengths[0],10)
+		self.assertEqual(stop_avg_lengths[9],-10)
+		
+		region = self.get_region(100,129,[110],[119])
+		self.assertEqual(len(region.summarize_stats()[0]),30)
+		self.assertEqual(region.origin,100)
+	
+	def test_summarize_stats_shifted(self):
+		"""The statistics are relative to the start of the masked region."""
+		a = self.get_region(0,99,[5,5,20,30],[25,26,45,80],[1,2,3,1]).summarize_stats()
+		b = self.get_region(123456,123555,[123461,123461,123476,123486],[123481,123482,123501,123536],[1,2,3,1]).summarize_stats()
+		
+		for x,y in zip(a,b):
+			numpy.testing.assert_array_equal(x,y)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+"""FlaiMapper: computational annotation of small ncRNA derived fragments using RNA-seq high throughput data
+
+ Here we present Fragment Location Annotation Identification mapper
+ (FlaiMapper), a method that extracts and annotates the locations of
+ sncRNA-derived RNAs (sncdRNAs). These sncdRNAs are often detected in
+ sequencing data and observed as fragments of their  precursor sncRNA.
+ Using small RNA-seq read alignments, FlaiMapper is able to annotate
+ fragments primarily by peak-detection on the start and  end position
+ densities followed by filtering and a reconstruction processes.
+ Copyright (C) 2011-2014:
+ - Youri Hoogstrate
+ - Elena S. Martens-Uzunova
+ - Guido Jenster
+ 
+ 
+ [License: GPL3]
+ 
+ This file is part of flaimapper.
+ 
+ flaimapper is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ flaimapper is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+
+import unittest,shutil,tempfile,os,gzip,time
+import pysam
+
+
+from flaimapper.OutputWriter import OutputWriter
+
+
+class FailingFile:
+	def write(self,data):
+		raise IOError("No space left on device")
+	
+	def flush(self):
+		pass
+	
+	def close(self):
+		pass
+
+
+class TestOutputWriter(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.lines = ["line\t"+str(i)+"\n" for i in range(5000)]
+	
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+	
+	def get_writer(self,filename,threaded):
+		writer = OutputWriter(os.path.join(self.directory,filename),threaded)
+		writer.buffer_size = 1000
+		
+		return writer
+	
+	def read(self,filename):
+		filename = os.path.join(self.directory,filename)
+		if(filename.endswith(".bgz")):
+			return pysam.BGZFile(filename).read()
+		elif(filename.endswith(".gz")):
+			return gzip.open(filename).read()
+		else:
+			with open(filename) as fh:
+				return fh.read()
+	
+	def wait_for(self,filename,data):
+		"""The writer thread writes the data asynchronously."""
+		for i in range(500):
+			if(self.read(filename) == data):
+				break
+			time.sleep(0.01)
+		
+		return self.read(filename)
+	
+	def test_round_trip(self):
+		for filename in ["fragments.txt","fragments.txt.gz","fragments.txt.bgz"]:
+			for threaded in [False,True]:
+				writer = self.get_writer(filename,threaded)
+				for line in self.lines:
+					writer.write(line)
+				writer.close()
+				
+				self.assertEqual(self.read(filename),"".join(self.lines))
+		
+		# Both are read by gzip, but only bgzip writes BGZF blocks
+		with open(os.path.join(self.directory,"fragments.txt.bgz"),"rb") as fh:
+			self.assertEqual(fh.read(16)[12:14],"BC")
+		with open(os.path.join(self.directory,"fragments.txt.gz"),"rb") as fh:
+			self.assertNotEqual(fh.read(16)[12:14],"BC")
+	
+	def test_flush(self):
+		"""flush() writes the buffered data through in order, except to
+		compressed files.
+		"""
+		for threaded in [False,True]:
+			writer = self.get_writer("flushed.txt",threaded)
+			writer.write(self.lines[0])
+			writer.flush()
+			self.assertEqual(self.wait_for("flushed.txt",self.lines[0]),self.lines[0])
+			
+			for line in self.lines[1:]:
+				writer.write(line)
+			writer.write(self.lines[0])
+			writer.flush()
+			self.assertEqual(self.wait_for("flushed.txt","".join(self.lines) + self.lines[0]),"".join(self.lines) + self.lines[0])
+			writer.close()
+		
+		writer = self.get_writer("flushed.txt.gz",False)
+		writer.write(self.lines[0])
+		writer.flush()
+		self.assertEqual(writer.buffered,len(self.lines[0]))
+		writer.close()
+		self.assertEqual(self.read("flushed.txt.gz"),self.lines[0])
+	
+	def test_thread_error(self):
+		"""Errors of the writer thread are raised by the main thread."""
+		writer = self.get_writer("failing.txt",True)
+		writer.fh.close()
+		writer.fh = FailingFile()
+		
+		writer.write(self.lines[0])
+		writer.flush_buffer()
+		self.assertRaises(IOError,writer.close)
+
+
+if __name__ == '__main__':
+	unittest.main()
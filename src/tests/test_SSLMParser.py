@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+"""FlaiMapper: computational annotation of small ncRNA derived fragments using RNA-seq high throughput data
+
+ Here we present Fragment Location Annotation Identification mapper
+ (FlaiMapper), a method that extracts and annotates the locations of
+ sncRNA-derived RNAs (sncdRNAs). These sncdRNAs are often detected in
+ sequencing data and observed as fragments of their  precursor sncRNA.
+ Using small RNA-seq read alignments, FlaiMapper is able to annotate
+ fragments primarily by peak-detection on the start and  end position
+ densities followed by filtering and a reconstruction processes.
+ Copyright (C) 2011-2014:
+ - Youri Hoogstrate
+ - Elena S. Martens-Uzunova
+ - Guido Jenster
+ 
+ 
+ [License: GPL3]
+ 
+ This file is part of flaimapper.
+ 
+ flaimapper is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ flaimapper is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+
+import unittest,os,shutil,tempfile
+
+
+from flaimapper.SSLMParser import SSLMParser
+
+
+class TestSSLMParser(unittest.TestCase):
+	"""Identical reads in SSLM files are collapsed in a single alignment,
+	of which the number of reads is given by a '_hits123' or '_x123'
+	suffix of the read name.
+	"""
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		os.mkdir(os.path.join(self.directory,"validated"))
+		
+		with open(os.path.join(self.directory,"idreadable.txt"),"w") as fh:
+			fh.write(">ref\tfile1\n")
+		
+		with open(os.path.join(self.directory,"validated","file1.fa"),"w") as fh:
+			fh.write(">ref\nACGTACGTACGTACGTACGT\n")
+			fh.write(">read1_hits3\n---TACGTACG---------\n")
+			fh.write(">read2_x2\n-----CGTACGTAC------\n")
+			fh.write(">read3\n---TACGTACG---------\n")
+	
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+	
+	def test_parse_alignments(self):
+		parser = SSLMParser("ref",0,19,[self.directory],"quiet")
+		alignments = [(start,stop,name,hits) for start,stop,name,line,hits in parser.parse_alignments()]
+		
+		self.assertEqual(alignments,[(3,11,"read1",3),(5,14,"read2",2),(3,11,"read3",1)])
+	
+	def test_parse_reads(self):
+		parser = SSLMParser("ref",0,19,[self.directory],"quiet")
+		
+		self.assertEqual([(read.start,read.stop,read.weight) for read in parser.parse_reads()],[(3,11,3),(5,14,2),(3,11,1)])
+		self.assertEqual([(read.name,read.weight) for read in parser.parse_reads(True)],[("read1",3),("read2",2),("read3",1)])
+	
+	def test_parse_stats(self):
+		"""The weighted reads must be counted as often as they were
+		sequenced.
+		"""
+		parser = SSLMParser("ref",0,19,[self.directory],"quiet")
+		start_positions,stop_positions,start_avg_lengths,stop_avg_lengths = parser.parse_stats()
+		
+		self.assertEqual(start_positions.tolist(),[0,0,0,4,0,2] + [0] * 14)
+		self.assertEqual(stop_positions.tolist(),[0] * 11 + [4,0,0,2] + [0] * 5)
+		self.assertEqual(start_avg_lengths[3],9)
+		self.assertEqual(stop_avg_lengths[14],-10)
+
+
+if __name__ == '__main__':
+	unittest.main()
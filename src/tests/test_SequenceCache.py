@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+"""FlaiMapper: computational annotation of small ncRNA derived fragments using RNA-seq high throughput data
+
+ Here we present Fragment Location Annotation Identification mapper
+ (FlaiMapper), a method that extracts and annotates the locations of
+ sncRNA-derived RNAs (sncdRNAs). These sncdRNAs are often detected in
+ sequencing data and observed as fragments of their  precursor sncRNA.
+ Using small RNA-seq read alignments, FlaiMapper is able to annotate
+ fragments primarily by peak-detection on the start and  end position
+ densities followed by filtering and a reconstruction processes.
+ Copyright (C) 2011-2014:
+ - Youri Hoogstrate
+ - Elena S. Martens-Uzunova
+ - Guido Jenster
+ 
+ 
+ [License: GPL3]
+ 
+ This file is part of flaimapper.
+ 
+ flaimapper is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ flaimapper is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+
+import unittest,shutil,tempfile
+import pysam
+
+
+from flaimapper.SequenceCache import SequenceCache
+
+from tests.synthetic import write_alignments
+
+
+class CountingFastaFile:
+	"""Records which sequences are fetched from a pysam Fastafile."""
+	def __init__(self,filename):
+		self.fasta_file = pysam.FastaFile(filename)
+		self.fetched = []
+	
+	def get_reference_length(self,name):
+		return self.fasta_file.get_reference_length(name)
+	
+	def fetch(self,name,start=None,stop=None):
+		self.fetched.append((name,start,stop))
+		return self.fasta_file.fetch(name,start,stop)
+
+
+class TestSequenceCache(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.fasta_file = write_alignments(self.directory,[("chr1",100),("chr2",100),("chr3",1000)],[],[])[1]
+		
+		self.reference = pysam.FastaFile(self.fasta_file)
+		self.counting = CountingFastaFile(self.fasta_file)
+		self.cache = SequenceCache(self.counting,250)
+	
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+	
+	def test_whole_sequences(self):
+		"""Short reference sequences are fetched entirely, once."""
+		for name,start,stop in [("chr1",10,20),("chr1",30,51),("chr1",0,100),("chr1",95,105)]:
+			self.assertEqual(self.cache.fetch(name,start,stop),self.reference.fetch(name,start,stop))
+		
+		self.assertEqual(self.counting.fetched,[("chr1",None,None)])
+		self.assertEqual(self.cache.size,100)
+	
+	def test_spans(self):
+		"""Of long reference sequences only the requested spans are
+		fetched, spans longer than the cache are not kept.
+		"""
+		for name,start,stop in [("chr3",100,200),("chr3",100,200),("chr3",150,250),("chr3",0,300),("chr3",0,300)]:
+			self.assertEqual(self.cache.fetch(name,start,stop),self.reference.fetch(name,start,stop))
+		
+		self.assertEqual(self.counting.fetched,[("chr3",100,200),("chr3",150,250),("chr3",0,300),("chr3",0,300)])
+		self.assertEqual(self.cache.size,200)
+	
+	def test_eviction(self):
+		"""The least recently used sequences are discarded first."""
+		self.cache.fetch("chr1",0,10)
+		self.cache.fetch("chr2",0,10)
+		self.cache.fetch("chr1",20,30)
+		self.assertEqual(self.cache.size,200)
+		
+		# Exceeds the maximal size, chr2 is used least recently
+		self.cache.fetch("chr3",0,100)
+		self.assertEqual(self.cache.size,200)
+		self.assertEqual(self.cache.sequences.keys(),[("chr1",None,None),("chr3",0,100)])
+		
+		self.assertEqual(self.cache.fetch("chr1",40,50),self.reference.fetch("chr1",40,50))
+		self.assertEqual(self.cache.fetch("chr2",40,50),self.reference.fetch("chr2",40,50))
+		self.assertEqual(self.cache.sequences.keys(),[("chr1",None,None),("chr2",None,None)])
+		
+		self.assertEqual(self.counting.fetched,[("chr1",None,None),("chr2",None,None),("chr3",0,100),("chr2",None,None)])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+"""FlaiMapper: computational annotation of small ncRNA derived fragments using RNA-seq high throughput data
+
+ Here we present Fragment Location Annotation Identification mapper
+ (FlaiMapper), a method that extracts and annotates the locations of
+ sncRNA-derived RNAs (sncdRNAs). These sncdRNAs are often detected in
+ sequencing data and observed as fragments of their  precursor sncRNA.
+ Using small RNA-seq read alignments, FlaiMapper is able to annotate
+ fragments primarily by peak-detection on the start and  end position
+ densities followed by filtering and a reconstruction processes.
+ Copyright (C) 2011-2014:
+ - Youri Hoogstrate
+ - Elena S. Martens-Uzunova
+ - Guido Jenster
+ 
+ 
+ [License: GPL3]
+ 
+ This file is part of flaimapper.
+ 
+ flaimapper is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ flaimapper is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+
+import unittest,random,shutil,tempfile,os
+import pysam
+
+
+from flaimapper.FlaiMapperObject import FlaiMapperObject
+from flaimapper.utils import parse_gff
+
+from tests.synthetic import write_alignments,random_reads
+
+
+class TestTiling(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		
+		rng = random.Random(19)
+		reads = random_reads(rng,"chr1",0,9900,600,40) + random_reads(rng,"chr2",0,900,10,40)
+		
+		# A long masked region, a short one and one on the other strand
+		self.bam_file,self.fasta_file,self.gtf_file = write_alignments(self.directory,[("chr1",10000),("chr2",1000)],reads,[("chr1",100,9899,"+"),("chr1",2000,2400,"-"),("chr2",0,999,"-")])
+	
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+	
+	def detect(self,filename,tile_size,sweep=False):
+		flaimapper = FlaiMapperObject('bam','quiet')
+		flaimapper.add_alignment(self.bam_file)
+		flaimapper.set_tiling(tile_size,40)
+		flaimapper.run(parse_gff(self.gtf_file),pysam.FastaFile(self.fasta_file),1,sweep)
+		flaimapper.export([(1,os.path.join(self.directory,filename)),(4,os.path.join(self.directory,filename+".gtf"))])
+		
+		with open(os.path.join(self.directory,filename)) as fh:
+			table = fh.read()
+		with open(os.path.join(self.directory,filename+".gtf")) as fh:
+			return (table,fh.read())
+	
+	def test_tiling(self):
+		"""Splitting the long masked region into tiles must not change the
+		results.
+		"""
+		table,features = self.detect("untiled.txt",0)
+		
+		self.assertGreater(len(table.split("\n")),100)
+		self.assertEqual(self.detect("tiled.txt",500),(table,features))
+		self.assertEqual(self.detect("tiled_sweep.txt",500,True),(table,features))
+	
+	def test_neighbour_chain(self):
+		"""Each peak of a chain of decreasing peaks removes the next one,
+		so the peaks that are kept depend on the first peak of the
+		chain. A chain that crosses the start of a tile must be
+		filtered as in the untiled masked region.
+		"""
+		directory = os.path.join(self.directory,"chain")
+		os.mkdir(directory)
+		
+		reads = []
+		for i in range(65):
+			reads += [("chr1",304 + 4 * i,323 + 4 * i)] * (400 - 4 * i)
+		bam_file,fasta_file,gtf_file = write_alignments(directory,[("chr1",2000)],reads,[("chr1",100,1899,"+")])
+		region = parse_gff(gtf_file)[0]
+		
+		results = []
+		for tile_size in [0,500]:
+			flaimapper = FlaiMapperObject('bam','quiet')
+			flaimapper.add_alignment(bam_file)
+			flaimapper.set_tiling(tile_size,30)
+			flaimapper.run([region],pysam.FastaFile(fasta_file))
+			flaimapper.write(1,os.path.join(directory,str(tile_size)+".txt"))
+			
+			with open(os.path.join(directory,str(tile_size)+".txt")) as fh:
+				results.append(fh.read())
+		
+		self.assertEqual(len(results[0].strip().split("\n")),34)
+		self.assertEqual(results[1],results[0])
+		
+		# Within the second tile alone, the chain is filtered differently
+		tiles,tile_index = flaimapper.get_tiles([region])
+		first,last = tile_index[tiles[1]][1:3]
+		self.assertTrue(tiles[1][1] < 304 + 4 * 64 and first < 304 + 4 * 64)
+		
+		peaks = flaimapper.detect_fragments(region).correctedPeaksStart
+		tile_peaks = flaimapper.detect_fragments(tiles[1]).correctedPeaksStart
+		self.assertNotEqual(sorted([pos for pos in tile_peaks if first <= pos <= last]),sorted([pos for pos in peaks if first <= pos <= last]))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+"""FlaiMapper: computational annotation of small ncRNA derived fragments using RNA-seq high throughput data
+
+ Here we present Fragment Location Annotation Identification mapper
+ (FlaiMapper), a method that extracts and annotates the locations of
+ sncRNA-derived RNAs (sncdRNAs). These sncdRNAs are often detected in
+ sequencing data and observed as fragments of their  precursor sncRNA.
+ Using small RNA-seq read alignments, FlaiMapper is able to annotate
+ fragments primarily by peak-detection on the start and  end position
+ densities followed by filtering and a reconstruction processes.
+ Copyright (C) 2011-2014:
+ - Youri Hoogstrate
+ - Elena S. Martens-Uzunova
+ - Guido Jenster
+ 
+ 
+ [License: GPL3]
+ 
+ This file is part of flaimapper.
+ 
+ flaimapper is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ flaimapper is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+
+import unittest,random,shutil,tempfile,os,sys,subprocess
+
+
+from flaimapper.utils import pair_outputs
+
+from tests.synthetic import write_alignments,random_reads
+
+
+class TestPairOutputs(unittest.TestCase):
+	def test_pair_outputs(self):
+		self.assertEqual(pair_outputs(None,None),[(1,"-")])
+		self.assertEqual(pair_outputs(None,["a.txt"]),[(1,"a.txt")])
+		self.assertEqual(pair_outputs([4],None),[(4,"-")])
+		self.assertEqual(pair_outputs([1,4,6],["a.txt","b.gtf","c.bed.gz"]),[(1,"a.txt"),(4,"b.gtf"),(6,"c.bed.gz")])
+	
+	def test_mismatch(self):
+		"""Each format requires its own output, only a single format or
+		output is defaulted.
+		"""
+		self.assertRaises(ValueError,pair_outputs,[1,4],["a.txt"])
+		self.assertRaises(ValueError,pair_outputs,[1],["a.txt","b.txt"])
+		self.assertRaises(ValueError,pair_outputs,None,["a.txt","b.txt"])
+		self.assertRaises(ValueError,pair_outputs,[1,4],None)
+
+
+class TestCommandLine(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		
+		rng = random.Random(25)
+		self.bam_file,self.fasta_file,self.gtf_file = write_alignments(self.directory,[("chr1",1000)],random_reads(rng,"chr1",0,900,10,40),[("chr1",0,999,"+")])
+	
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+	
+	def flaimapper(self,arguments):
+		"""
+		----
+		@return: exit code and stderr of bin/flaimapper
+		@rtype: tuple
+		"""
+		src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+		environment = dict(os.environ)
+		environment['PYTHONPATH'] = src
+		
+		process = subprocess.Popen([sys.executable,os.path.join(src,"bin","flaimapper"),"-m",self.gtf_file,"-r",self.fasta_file] + arguments + [self.bam_file],cwd=self.directory,env=environment,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+		stdout,stderr = process.communicate()
+		
+		return (process.returncode,stderr)
+	
+	def read(self,filename):
+		with open(os.path.join(self.directory,filename)) as fh:
+			return fh.read()
+	
+	def test_outputs(self):
+		self.assertEqual(self.flaimapper(["-o","default.txt"])[0],0)
+		self.assertEqual(self.flaimapper(["-f","4","-o","default.gtf"])[0],0)
+		self.assertEqual(self.flaimapper(["-f","1","-o","fragments.txt","-f","4","-o","fragments.gtf"])[0],0)
+		
+		self.assertTrue(self.read("default.txt").startswith("Fragment\t"))
+		self.assertGreater(len(self.read("default.txt").split("\n")),2)
+		self.assertEqual(self.read("fragments.txt"),self.read("default.txt"))
+		self.assertEqual(self.read("fragments.gtf"),self.read("default.gtf"))
+	
+	def test_mismatch(self):
+		for arguments in [["-f","1","-f","4","-o","a.txt"],["-o","a.txt","-o","b.txt"]]:
+			returncode,stderr = self.flaimapper(arguments)
+			
+			self.assertEqual(returncode,2)
+			self.assertIn("Each --format requires its own --output",stderr)
+			self.assertFalse(os.path.exists(os.path.join(self.directory,"a.txt")))
+
+
+if __name__ == '__main__':
+	unittest.main()